@@ -0,0 +1,203 @@
+"""Bitboard helpers for Reversi positions.
+
+A position is a pair of 64-bit integers, one per player. Square (x, y) of GameState.board is bit x * 8 + y.
+"""
+from .consts import BOARD_COLS, BOARD_ROWS, X_PLAYER, O_PLAYER
+
+FULL = (1 << (BOARD_ROWS * BOARD_COLS)) - 1
+
+
+def _mask(predicate):
+    return sum(1 << (x * BOARD_COLS + y) for x in range(BOARD_ROWS) for y in range(BOARD_COLS) if predicate(x, y))
+
+
+NOT_FIRST_COL = _mask(lambda x, y: y != 0)
+NOT_LAST_COL = _mask(lambda x, y: y != BOARD_COLS - 1)
+CORNERS = _mask(lambda x, y: x in (0, BOARD_ROWS - 1) and y in (0, BOARD_COLS - 1))
+
+# One (shift, mask) pair per direction. A positive shift is a left shift. The mask drops the bits that wrapped
+# around to the other side of the board.
+SHIFTS = [
+    (1, NOT_FIRST_COL), (-1, NOT_LAST_COL),
+    (BOARD_COLS, FULL), (-BOARD_COLS, FULL),
+    (BOARD_COLS + 1, NOT_FIRST_COL), (BOARD_COLS - 1, NOT_LAST_COL),
+    (-BOARD_COLS + 1, NOT_FIRST_COL), (-BOARD_COLS - 1, NOT_LAST_COL),
+]
+
+
+def square(x, y):
+    return 1 << (x * BOARD_COLS + y)
+
+
+def from_state(state):
+    """Converts a GameState board to bitboards.
+
+    :param GameState state: The state to convert.
+    :return: A tuple: (X player bits, O player bits)
+    """
+    x_bits = 0
+    o_bits = 0
+    for x in range(BOARD_ROWS):
+        for y in range(BOARD_COLS):
+            if state.board[x][y] == X_PLAYER:
+                x_bits |= square(x, y)
+            elif state.board[x][y] == O_PLAYER:
+                o_bits |= square(x, y)
+    return x_bits, o_bits
+
+
+def popcount(bits):
+    return bin(bits).count('1')
+
+
+def shift(bits, amount, mask):
+    if amount > 0:
+        return (bits << amount) & mask
+    return (bits >> -amount) & mask
+
+
+def move_mask(own, opp):
+    """Returns the bits of all the legal moves of the player owning 'own'.
+    """
+    empty = ~(own | opp) & FULL
+    moves = 0
+    for amount, mask in SHIFTS:
+        line = shift(own, amount, mask) & opp
+        for _ in range(5):
+            line |= shift(line, amount, mask) & opp
+        moves |= shift(line, amount, mask) & empty
+    return moves
+
+
+# ===============================================================================
+# Symmetries
+# The board has 8 symmetries (4 rotations, each optionally reflected). Symmetry number 'sym' applies, in order, a
+# transpose if sym & 4, a vertical flip (x -> 7 - x) if sym & 2 and a mirror (y -> 7 - y) if sym & 1.
+# ===============================================================================
+SYMMETRIES = range(8)
+
+
+def flip_vertical(bits):
+    return int.from_bytes(bits.to_bytes(8, 'little'), 'big')
+
+
+def mirror(bits):
+    bits = ((bits >> 1) & 0x5555555555555555) | ((bits & 0x5555555555555555) << 1)
+    bits = ((bits >> 2) & 0x3333333333333333) | ((bits & 0x3333333333333333) << 2)
+    return ((bits >> 4) & 0x0F0F0F0F0F0F0F0F) | ((bits & 0x0F0F0F0F0F0F0F0F) << 4)
+
+
+def transpose(bits):
+    t = 0x0F0F0F0F00000000 & (bits ^ (bits << 28))
+    bits ^= t ^ (t >> 28)
+    t = 0x3333000033330000 & (bits ^ (bits << 14))
+    bits ^= t ^ (t >> 14)
+    t = 0x5500550055005500 & (bits ^ (bits << 7))
+    return bits ^ t ^ (t >> 7)
+
+
+def transform(bits, sym):
+    if sym & 4:
+        bits = transpose(bits)
+    if sym & 2:
+        bits = flip_vertical(bits)
+    if sym & 1:
+        bits = mirror(bits)
+    return bits
+
+
+def _transform_square(x, y, sym):
+    if sym & 4:
+        x, y = y, x
+    if sym & 2:
+        x = BOARD_ROWS - 1 - x
+    if sym & 1:
+        y = BOARD_COLS - 1 - y
+    return x, y
+
+
+# SQUARE_MAPS[sym][x][y] is the square (x, y) moves to under 'sym', INVERSE_MAPS[sym] maps it back.
+SQUARE_MAPS = [[[_transform_square(x, y, sym) for y in range(BOARD_COLS)] for x in range(BOARD_ROWS)]
+               for sym in SYMMETRIES]
+INVERSE_MAPS = [[[None] * BOARD_COLS for _ in range(BOARD_ROWS)] for _ in SYMMETRIES]
+for _sym in SYMMETRIES:
+    for _x in range(BOARD_ROWS):
+        for _y in range(BOARD_COLS):
+            _tx, _ty = SQUARE_MAPS[_sym][_x][_y]
+            INVERSE_MAPS[_sym][_tx][_ty] = (_x, _y)
+
+
+def transform_move(move, sym):
+    """Maps a move (x, y) of a position to the same move in the position transformed by 'sym'.
+    """
+    return list(SQUARE_MAPS[sym][move[0]][move[1]])
+
+
+def inverse_transform_move(move, sym):
+    """Maps a move of the position transformed by 'sym' back to the original position.
+    """
+    return list(INVERSE_MAPS[sym][move[0]][move[1]])
+
+
+def canonical(own, opp):
+    """Finds the canonical form of a position: the smallest (own, opp) pair among its 8 symmetric images.
+    Symmetric positions have the same canonical form. The opening positions have fewer distinct images, which the
+    minimum handles on its own.
+
+    :return: A tuple: (canonical own bits, canonical opp bits, the symmetry that maps the position to it)
+    """
+    best = None
+    for sym in SYMMETRIES:
+        image = (transform(own, sym), transform(opp, sym), sym)
+        if best is None or image < best:
+            best = image
+    return best
+
+
+# ===============================================================================
+# Moves and exact solving
+# ===============================================================================
+def bit_to_move(bit):
+    return list(divmod(bit.bit_length() - 1, BOARD_COLS))
+
+
+def flips(own, opp, move):
+    """Returns the bits of the discs flipped when the player owning 'own' plays the single bit 'move'.
+    """
+    flipped = 0
+    for amount, mask in SHIFTS:
+        line = 0
+        current = shift(move, amount, mask)
+        while current & opp:
+            line |= current
+            current = shift(current, amount, mask)
+        if current & own:
+            flipped |= line
+    return flipped
+
+
+def solve(own, opp, alpha=-64, beta=64):
+    """Solves a position exactly with alpha-beta negamax. As in GameState, the game ends when the player to move has
+    no moves. Only practical with few empty squares.
+
+    :return: A tuple: (the final disc difference from the point of view of the player to move, owning 'own',
+             the best move's bit or 0 if the game is over)
+    """
+    moves = move_mask(own, opp)
+    if not moves:
+        return popcount(own) - popcount(opp), 0
+    best_score = -65
+    best_move = 0
+    while moves:
+        move = moves & -moves
+        moves ^= move
+        flipped = flips(own, opp, move)
+        score = -solve(opp ^ flipped, own | move | flipped, -beta, -alpha)[0]
+        if score > best_score:
+            best_score = score
+            best_move = move
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+    return best_score, best_move
@@ -0,0 +1,207 @@
+"""Vectorized versions of the Reversi.bitboard helpers. Every function works on NumPy uint64 arrays, one element per
+position. Requires NumPy, which the game itself does not.
+
+Also plays random games in lockstep, all the games of a batch advancing by one move per step. To check the playouts
+against the rules of Reversi.board:
+    python3 -m Reversi.bitboard_np 1000
+"""
+import sys
+
+import numpy as np
+
+from .bitboard import SHIFTS, CORNERS, FULL, _mask, from_state
+from .board import GameState
+from .consts import BOARD_COLS, X_PLAYER
+
+_POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+_SHIFTS = [(np.uint64(abs(amount)), amount > 0, np.uint64(mask)) for amount, mask in SHIFTS]
+_FULL = np.uint64(FULL)
+_CORNERS = np.uint64(CORNERS)
+
+# The squares the hand-written potential mobility counts as neighbours, see Player.is_in_board.
+_INNER = np.uint64(_mask(lambda x, y: x >= 1 and y >= 1))
+
+
+def popcount(bits):
+    bits = np.ascontiguousarray(bits, dtype=np.uint64)
+    return _POPCOUNT8[bits.view(np.uint8)].reshape(bits.shape + (8,)).sum(axis=-1, dtype=np.int64)
+
+
+def _shift(bits, amount, left, mask):
+    if left:
+        return np.left_shift(bits, amount) & mask
+    return np.right_shift(bits, amount) & mask
+
+
+def move_mask(own, opp):
+    """Returns the legal move bits of the player owning 'own', for every position.
+    """
+    empty = ~(own | opp) & _FULL
+    moves = np.zeros_like(own)
+    for amount, left, mask in _SHIFTS:
+        line = _shift(own, amount, left, mask) & opp
+        for _ in range(5):
+            line |= _shift(line, amount, left, mask) & opp
+        moves |= _shift(line, amount, left, mask) & empty
+    return moves
+
+
+def dilate(bits):
+    """Returns the bits of all the squares adjacent to a set bit.
+    """
+    out = np.zeros_like(bits)
+    for amount, left, mask in _SHIFTS:
+        out |= _shift(bits, amount, left, mask)
+    return out
+
+
+def evaluation_features(own, opp):
+    """Computes the terms of the competition player's utility, from the point of view of the player owning 'own'.
+
+    :param own: uint64 array of the player's discs.
+    :param opp: uint64 array of the opponent's discs.
+    :return: float64 array of shape (N, 4): delta tiles, mobility, potential mobility and corner ratio, each already
+             multiplied by its game phase factor (tiles / 32 or (64 - tiles) / 32).
+    """
+    own = np.asarray(own, dtype=np.uint64)
+    opp = np.asarray(opp, dtype=np.uint64)
+    tiles = popcount(own | opp)
+    empty = ~(own | opp) & _FULL
+
+    delta_tiles = popcount(own) - popcount(opp)
+    mobility = popcount(move_mask(own, opp))
+    potential_mobility = popcount(own & dilate(empty & _INNER))
+    corner_ratio = popcount(own & _CORNERS) - popcount(opp & _CORNERS)
+
+    features = np.empty(own.shape + (4,), dtype=np.float64)
+    features[..., 0] = tiles * delta_tiles / 32
+    late = (64 - tiles) / 32
+    features[..., 1] = late * mobility
+    features[..., 2] = late * potential_mobility
+    features[..., 3] = late * corner_ratio
+    return features
+
+
+def flips(own, opp, move):
+    """Returns the bits of the discs flipped when the players owning 'own' play the single bits of 'move'.
+    """
+    flipped = np.zeros_like(own)
+    for amount, left, mask in _SHIFTS:
+        line = np.zeros_like(own)
+        bracket = np.zeros_like(own)
+        current = _shift(move, amount, left, mask)
+        # A line has at most 6 opponent discs, closed by an own disc
+        for _ in range(7):
+            bracket |= current & own
+            current &= opp
+            line |= current
+            current = _shift(current, amount, left, mask)
+        flipped |= np.where(bracket != 0, line, np.uint64(0))
+    return flipped
+
+
+def random_moves(moves, rng):
+    """Picks one random move bit of every moves mask. Masks without moves give 0.
+
+    :param rng: A numpy.random.Generator.
+    """
+    count = popcount(moves)
+    skip = (rng.random(moves.shape) * count).astype(np.int64)
+    moves = moves.copy()
+    for i in range(int(skip.max(initial=0))):
+        # Clears the lowest bit of the masks that still skip one
+        moves = np.where(skip > i, moves & (moves - np.uint64(1)), moves)
+    return moves & (~moves + np.uint64(1))
+
+
+def random_playouts(own, opp, rng, allow_pass=False, record=False):
+    """Plays random games from every position, all in lockstep, until they are over.
+
+    :param own: uint64 array of the discs of the player to move.
+    :param opp: uint64 array of the opponent's discs.
+    :param rng: A numpy.random.Generator.
+    :param allow_pass: As in Reversi.board, a game ends by default when the player to move has no moves. When True, that
+                       player passes instead, and the game ends when neither player has a move.
+    :param record: Whether to also return the moves.
+    :return: int64 array of the final disc differences, from the point of view of the player to move in each starting
+             position. If record, also a uint64 array of shape (steps, N) of the move bit played at every step, 0 for
+             passes and finished games.
+    """
+    own = np.array(own, dtype=np.uint64)
+    opp = np.array(opp, dtype=np.uint64)
+    # Whether the player to move is the one who moved first
+    first = np.ones(own.shape, dtype=bool)
+    active = np.ones(own.shape, dtype=bool)
+    history = []
+    while active.any():
+        moves = move_mask(own, opp)
+        if allow_pass:
+            passing = active & (moves == 0) & (move_mask(opp, own) != 0)
+            active &= (moves != 0) | passing
+        else:
+            passing = np.zeros(own.shape, dtype=bool)
+            active &= moves != 0
+        move = np.where(active & ~passing, random_moves(moves, rng), np.uint64(0))
+        flipped = flips(own, opp, move)
+        switch = active
+        own, opp = (np.where(switch, opp ^ flipped, own),
+                    np.where(switch, own | move | flipped, opp))
+        first ^= switch
+        if record:
+            history.append(move)
+    difference = popcount(own) - popcount(opp)
+    result = np.where(first, difference, -difference)
+    if record:
+        return result, np.array(history, dtype=np.uint64).reshape(len(history), own.shape[0])
+    return result
+
+
+def playout_scores(own, opp, games, rng, allow_pass=False):
+    """Estimates a position's chances with random games, e.g. to evaluate an MCTS leaf.
+
+    :param own: The discs of the player to move, an int.
+    :param opp: The opponent's discs, an int.
+    :return: A tuple: (the share of won games counting draws as half, the mean final disc difference), for the player
+             to move.
+    """
+    result = random_playouts(np.full(games, own, dtype=np.uint64), np.full(games, opp, dtype=np.uint64), rng,
+                             allow_pass)
+    return float(((result > 0) + 0.5 * (result == 0)).mean()), float(result.mean())
+
+
+def check_rules(games, seed=None):
+    """Plays random games from the initial position and replays every one through Reversi.board.GameState, checking
+    the legal moves of every position and the final result.
+
+    :return: The number of positions checked.
+    :raises AssertionError: On the first difference.
+    """
+    rng = np.random.default_rng(seed)
+    x_bits, o_bits = from_state(GameState())
+    result, history = random_playouts(np.full(games, x_bits, dtype=np.uint64), np.full(games, o_bits, dtype=np.uint64),
+                                      rng, record=True)
+    checked = 0
+    for game in range(games):
+        state = GameState()
+        for bit in history[:, game]:
+            x_bits, o_bits = from_state(state)
+            own, opp = (x_bits, o_bits) if state.curr_player == X_PLAYER else (o_bits, x_bits)
+            expected = sum(1 << (x * BOARD_COLS + y) for x, y in state.get_possible_moves())
+            assert int(move_mask(np.array([own], dtype=np.uint64), np.array([opp], dtype=np.uint64))[0]) == expected
+            checked += 1
+            if not bit:
+                assert not expected, 'game {} ended with moves left'.format(game)
+                break
+            assert int(bit) & expected, 'game {} played an illegal move'.format(game)
+            x, y = divmod(int(bit).bit_length() - 1, BOARD_COLS)
+            state.perform_move(x, y)
+        else:
+            assert not state.get_possible_moves(), 'game {} was not finished'.format(game)
+        x_bits, o_bits = from_state(state)
+        assert int(popcount(np.array([x_bits], dtype=np.uint64))[0] -
+                   popcount(np.array([o_bits], dtype=np.uint64))[0]) == result[game]
+    return checked
+
+
+if __name__ == '__main__':
+    print('{} positions checked'.format(check_rules(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)))
@@ -1,9 +1,19 @@
 """A game-specific implementations of utility functions.
 """
 from __future__ import print_function, division
+import os
+
 from .consts import *
+from .bitboard import from_state, canonical
+
+DIRECTIONS = [[0, 1], [1, 1], [1, 0], [1, -1], [0, -1], [-1, -1], [-1, 0], [-1, 1]]
+
 
 class GameState:
+    # When True, get_possible_moves checks the incrementally maintained moves against a full regeneration.
+    # Also enabled by setting the REVERSI_DEBUG_MOVES environment variable to 1.
+    debug_moves = os.environ.get('REVERSI_DEBUG_MOVES') == '1'
+
     def __init__(self):
         """ Initializing the board and current player.
         """
@@ -22,36 +32,40 @@ class GameState:
         self.board[4][4] = X_PLAYER
                     
         self.curr_player = X_PLAYER
-    
+        self.refresh_moves()
+
     def isOnBoard(self, x, y):
     # Returns True if the coordinates are located on the board.
         return x >= 0 and x <= 7 and y >= 0 and y <=7
 
     def isValidMove(self, xstart, ystart):
+        return self.get_flips(xstart, ystart, self.curr_player)
+
+    def get_flips(self, xstart, ystart, color):
+        # Returns the tiles 'color' flips by playing at (xstart, ystart), or False if it is not a valid move.
+        # Does not change the board.
         if self.board[xstart][ystart] != EM or not self.isOnBoard(xstart, ystart):
             return False
 
-        self.board[xstart][ystart] = self.curr_player # temporarily set the tile on the board.
-
         tilesToFlip = []
-        for xdirection, ydirection in [[0, 1], [1, 1], [1, 0], [1, -1], [0, -1], [-1, -1], [-1, 0], [-1, 1]]:
+        for xdirection, ydirection in DIRECTIONS:
             x, y = xstart, ystart
             x += xdirection # first step in the direction
             y += ydirection # first step in the direction
-            if self.isOnBoard(x, y) and self.board[x][y] == OPPONENT_COLOR[self.curr_player]:
+            if self.isOnBoard(x, y) and self.board[x][y] == OPPONENT_COLOR[color]:
                 # There is a piece belonging to the other player next to our piece.
                 x += xdirection
                 y += ydirection
                 if not self.isOnBoard(x, y):
                     continue
-                while self.board[x][y] == OPPONENT_COLOR[self.curr_player]:
+                while self.board[x][y] == OPPONENT_COLOR[color]:
                     x += xdirection
                     y += ydirection
                     if not self.isOnBoard(x, y): # break out of while loop, then continue in for loop
                         break
                 if not self.isOnBoard(x, y):
                     continue
-                if self.board[x][y] == self.curr_player:
+                if self.board[x][y] == color:
                     # There are pieces to flip over. Go in the reverse direction until we reach the original space, noting all the tiles along the way.
                     while True:
                         x -= xdirection
@@ -60,21 +74,83 @@ class GameState:
                             break
                         tilesToFlip.append([x, y])
 
-        self.board[xstart][ystart] = EM # restore the empty space
         if len(tilesToFlip) == 0: # If no tiles were flipped, this is not a valid move.
             return False
         return tilesToFlip
 
+    def has_flips(self, xstart, ystart, color):
+        # A faster get_flips for an empty square, that only tells whether 'color' can play there.
+        board = self.board
+        opponent = OPPONENT_COLOR[color]
+        for xdirection, ydirection in DIRECTIONS:
+            x, y = xstart + xdirection, ystart + ydirection
+            if not (0 <= x <= 7 and 0 <= y <= 7) or board[x][y] != opponent:
+                continue
+            x += xdirection
+            y += ydirection
+            while 0 <= x <= 7 and 0 <= y <= 7:
+                if board[x][y] == color:
+                    return True
+                if board[x][y] != opponent:
+                    break
+                x += xdirection
+                y += ydirection
+        return False
 
     def get_possible_moves(self):
+        validMoves = [list(move) for move in sorted(self.moves[self.curr_player])]
+        if self.debug_moves:
+            expected = self.generate_possible_moves(self.curr_player)
+            assert validMoves == expected, 'Incremental moves {} differ from {}'.format(validMoves, expected)
+        return validMoves
+
+    def generate_possible_moves(self, color):
+        # Tests all the squares. Used to build and check the incrementally maintained moves.
         validMoves = []
 
         for x in range(BOARD_COLS):
             for y in range(BOARD_ROWS):
-                if self.isValidMove(x, y) != False:
+                if self.get_flips(x, y, color) != False:
                     validMoves.append([x, y])
         return validMoves
 
+    def refresh_moves(self):
+        """Recomputes the legal moves of both players from scratch. Call it after changing the board directly.
+        """
+        self.moves = {color: set(tuple(move) for move in self.generate_possible_moves(color))
+                      for color in (X_PLAYER, O_PLAYER)}
+
+    def update_moves(self, changed):
+        """Updates the legal moves of both players after the given squares changed. Only the empty squares on the
+        lines through a changed square can change legality: the first empty square met walking away from it in each
+        direction. The sets are replaced rather than modified, so copies of the state can share them.
+
+        :param changed: The list of changed squares [x, y].
+        """
+        affected = set()
+        for cx, cy in changed:
+            for xdirection, ydirection in DIRECTIONS:
+                x, y = cx + xdirection, cy + ydirection
+                while 0 <= x <= 7 and 0 <= y <= 7:
+                    if self.board[x][y] == EM:
+                        affected.add((x, y))
+                        break
+                    x += xdirection
+                    y += ydirection
+
+        moves = {}
+        for color in (X_PLAYER, O_PLAYER):
+            color_moves = set(self.moves[color])
+            for x, y in changed:
+                color_moves.discard((x, y))
+            for x, y in affected:
+                if self.has_flips(x, y, color):
+                    color_moves.add((x, y))
+                else:
+                    color_moves.discard((x, y))
+            moves[color] = color_moves
+        self.moves = moves
+
     def perform_move(self, xstart, ystart):       
         tilesToFlip = self.isValidMove(xstart, ystart)
         if tilesToFlip == False:
@@ -83,6 +159,7 @@ class GameState:
         self.board[xstart][ystart] = self.curr_player
         for x, y in tilesToFlip:
             self.board[x][y] = self.curr_player
+        self.update_moves([[xstart, ystart]] + tilesToFlip)
         # Updating the current player.
         self.curr_player = OPPONENT_COLOR[self.curr_player]
         return True
@@ -121,6 +198,32 @@ class GameState:
         print('    0   1   2   3   4   5   6   7')
         print("\n" + self.curr_player + " Player Turn!\n\n")
 
+    def canonical_key(self, color=None):
+        """Returns a key shared by this position and all the positions symmetric to it, for caches and tables.
+
+        :param color: The player whose point of view the key is from. Defaults to the current player.
+        :return: A tuple: (hashable key, the symmetry that maps this position to the canonical one, see
+                 Reversi.bitboard.canonical)
+        """
+        color = color or self.curr_player
+        x_bits, o_bits = from_state(self)
+        own, opp = (x_bits, o_bits) if color == X_PLAYER else (o_bits, x_bits)
+        own, opp, sym = canonical(own, opp)
+        return (own, opp, color == self.curr_player), sym
+
+    def snapshot(self):
+        """Returns a GameStateSnapshot of this state, a cheap copy to hand to the players.
+        """
+        return GameStateSnapshot(self)
+
+    def __deepcopy__(self, memo):
+        # The move sets are never modified in place (see update_moves), so the copy shares them.
+        state = GameState.__new__(GameState)
+        state.board = [list(column) for column in self.board]
+        state.curr_player = self.curr_player
+        state.moves = self.moves
+        return state
+
     def __hash__(self):
         """This object can be inserted into a set or as dict key. NOTICE: Changing the object after it has been inserted
         into a set or dict (as key) may have unpredicted results!!!
@@ -130,5 +233,32 @@ class GameState:
                               for j in range(BOARD_COLS)] + [self.curr_player]))
 
     def __eq__(self, other):
-        return isinstance(other, GameState) and self.board == other.board and self.curr_player == other.curr_player
+        return (isinstance(other, GameState) and self.curr_player == other.curr_player and
+                all(tuple(column) == tuple(other_column) for column, other_column in zip(self.board, other.board)))
+
+
+class GameStateSnapshot(GameState):
+    """A copy-on-write GameState. Its board is a tuple of column tuples, frozen at the time of the snapshot, so taking
+    it copies no list and the state it was taken from can change afterwards. Reading it works like a GameState.
+
+    perform_move first gives the snapshot a private list board, and deepcopy returns a plain GameState, so players
+    that only read the state or copy it before moving never pay for a mutable copy. Assigning a square of the frozen
+    board directly raises a TypeError.
+    """
+
+    def __init__(self, state):
+        self.board = state.board if isinstance(state.board, tuple) else tuple(map(tuple, state.board))
+        self.curr_player = state.curr_player
+        # The move sets are never modified in place (see update_moves), so the snapshot shares them.
+        self.moves = state.moves
+
+    def materialize(self):
+        """Replaces the frozen board with a private list board.
+        """
+        if isinstance(self.board, tuple):
+            self.board = [list(column) for column in self.board]
+
+    def perform_move(self, xstart, ystart):
+        self.materialize()
+        return GameState.perform_move(self, xstart, ystart)
 
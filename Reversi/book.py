@@ -0,0 +1,303 @@
+"""Opening book files.
+
+A text book (.gam) has one game per line, like '+d3-c5+f6... : +12', where the moves are the column letter and row
+number of each move and the number is the final disc difference for the first player.
+
+A text book is first indexed in a trie of BookNode, keyed by move, so that a move sequence shared by many lines is
+replayed once, with the statistics of all the lines through it.
+
+Books are keyed on canonical positions (see Reversi.bitboard.canonical), so a line also matches all its rotated and
+reflected equivalents. Moves are stored in the canonical position's coordinates and mapped back on lookup.
+
+A compiled book is a sorted array of fixed-size records, one per (position, move) pair of the text book:
+    canonical position hash, move (x * 8 + y), games, wins, draws, losses
+with the statistics from the point of view of the player to move. It is memory-mapped and binary searched, so
+opening it costs the same for any book size, and several processes share its pages.
+
+To compile a book:
+    python3 -m Reversi.book Reversi/book.gam Reversi/book.bin
+The compiling is done offline, by this command or by book_expander, never by the players.
+"""
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+
+from .bitboard import FULL, square, flips, move_mask, from_state, canonical, transform_move, inverse_transform_move
+from .board import GameState
+from .consts import BOARD_COLS, X_PLAYER
+
+MAGIC = b'RVBOOK02'
+HEADER = struct.Struct('<8sI4x')
+RECORD = struct.Struct('<QB3xIIII')
+
+_MOVES = re.compile(r'(?:[+-][a-h][1-8])+')
+_MOVE = re.compile(r'[+-]([a-h][1-8])')
+_RESULT = re.compile(r'([+-]?\d+)')
+
+
+def parse_gam_line(line):
+    """
+    :return: A tuple: (list of the moves as (x, y), the first player's result or None), or None for a line without
+             moves.
+    """
+    line = line.strip()
+    moves = _MOVES.match(line)
+    if moves is None:
+        return None
+    result = _RESULT.search(line[moves.end():])
+    return ([(int(move[1]) - 1, ord(move[0]) - ord('a')) for move in _MOVE.findall(moves.group(0))],
+            int(result.group(1)) if result else None)
+
+
+def format_gam_line(moves, result=None):
+    """The inverse of parse_gam_line.
+    """
+    line = ''.join('{}{}{}'.format('+' if i % 2 == 0 else '-', chr(ord('a') + y), x + 1)
+                   for i, (x, y) in enumerate(moves))
+    if result is not None:
+        line += ': {:+03d}'.format(result)
+    return line
+
+
+def position_hash(own, opp):
+    """A 64-bit hash of a position, from the point of view of the player to move, owning 'own'.
+    """
+    h = (own * 0x9E3779B97F4A7C15 + opp * 0xC2B2AE3D27D4EB4F) & FULL
+    h ^= h >> 29
+    h = (h * 0xBF58476D1CE4E5B9) & FULL
+    return h ^ (h >> 32)
+
+
+def score(games, wins, draws, losses):
+    """The expected score of a continuation, with one virtual win and loss so rare lines are not trusted.
+    """
+    return (wins + 0.5 * draws + 0.5 * (games - wins - draws - losses) + 1) / (games + 2)
+
+
+class BookNode:
+    """A book position, reached by the moves on the path from the root.
+    The statistics are of the book games that went through it, from the first (X) player's point of view.
+    """
+    __slots__ = ['children', 'games', 'wins', 'draws', 'losses']
+
+    def __init__(self):
+        # Move index (x * 8 + y) -> BookNode
+        self.children = {}
+        self.games = 0
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+
+    def add_game(self, result):
+        """
+        :param result: The final disc difference for the first player, or None if the game has no result.
+        """
+        self.games += 1
+        if result is None:
+            return
+        if result > 0:
+            self.wins += 1
+        elif result < 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+
+def book_trie(lines):
+    """Indexes text book lines by move.
+
+    :return: The root BookNode, of the initial position.
+    """
+    root = BookNode()
+    for line in lines:
+        parsed = parse_gam_line(line)
+        if parsed is None:
+            continue
+        moves, result = parsed
+        node = root
+        node.add_game(result)
+        for x, y in moves:
+            node = node.children.setdefault(x * BOARD_COLS + y, BookNode())
+            node.add_game(result)
+    return root
+
+
+def book_statistics(lines):
+    """Counts the games and results of every (canonical position, move) pair of text book lines. The lines are
+    replayed through their trie, so every distinct position is canonicalized once. A line is cut at its first
+    illegal move.
+
+    :return: A dict: (position hash, move index) -> [games, wins, draws, losses]
+    """
+    stats = {}
+    own, opp = from_state(GameState())
+    # (node, bits of the player to move, bits of the other player, True if the first player is to move)
+    stack = [(book_trie(lines), own, opp, True)]
+    while stack:
+        node, own, opp, first_player = stack.pop()
+        if not node.children:
+            continue
+        legal = move_mask(own, opp)
+        canonical_own, canonical_opp, sym = canonical(own, opp)
+        h = position_hash(canonical_own, canonical_opp)
+        for move, child in node.children.items():
+            bit = square(*divmod(move, BOARD_COLS))
+            if not bit & legal:
+                continue
+            x, y = transform_move(divmod(move, BOARD_COLS), sym)
+            entry = stats.setdefault((h, x * BOARD_COLS + y), [0, 0, 0, 0])
+            entry[0] += child.games
+            entry[1] += child.wins if first_player else child.losses
+            entry[2] += child.draws
+            entry[3] += child.losses if first_player else child.wins
+            flipped = flips(own, opp, bit)
+            stack.append((child, opp ^ flipped, own | bit | flipped, not first_player))
+    return stats
+
+
+def compile_book(gam_path, bin_path):
+    """Compiles a text book.
+
+    :return: The number of records written.
+    """
+    with open(gam_path, 'r') as gam:
+        stats = book_statistics(gam)
+
+    # A temporary file of its own, so that concurrent compilations never replace the book with a partial file
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(bin_path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(HEADER.pack(MAGIC, len(stats)))
+            for (h, move), (games, wins, draws, losses) in sorted(stats.items()):
+                out.write(RECORD.pack(h, move, games, wins, draws, losses))
+        os.replace(temp_path, bin_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return len(stats)
+
+
+class Book:
+    """The lookups shared by the book implementations, which provide lookup(position hash).
+    """
+
+    def lookup_state(self, state):
+        """Finds the book continuations of a GameState, in the state's coordinates.
+
+        :return: A list of (x, y, games, wins, draws, losses), empty out of book.
+        """
+        x_bits, o_bits = from_state(state)
+        if state.curr_player == X_PLAYER:
+            own, opp, sym = canonical(x_bits, o_bits)
+        else:
+            own, opp, sym = canonical(o_bits, x_bits)
+        return [tuple(inverse_transform_move(divmod(move, BOARD_COLS), sym)) + tuple(stats)
+                for move, stats in self.lookup(position_hash(own, opp))]
+
+    def best_move(self, state):
+        """Returns the continuation with the best score for the player to move, or None out of book.
+        """
+        continuations = self.lookup_state(state)
+        if not continuations:
+            return None
+        best = max(continuations, key=lambda c: (score(*c[2:]), c[2]))
+        return best[0], best[1]
+
+
+class MemoryBook(Book):
+    def __init__(self, stats=None):
+        """A book held in a dict, for text books that were not compiled.
+
+        :param stats: As returned by book_statistics.
+        """
+        self.positions = {}
+        for (h, move), entry in sorted((stats or {}).items()):
+            self.positions.setdefault(h, []).append((move, entry))
+
+    @classmethod
+    def load(cls, gam_path):
+        """Parses a text book, or returns an empty book if there is none at the given path.
+        """
+        if not os.path.isfile(gam_path):
+            return cls()
+        with open(gam_path, 'r') as gam:
+            return cls(book_statistics(gam))
+
+    def lookup(self, h):
+        """
+        :return: A list of (move index, (games, wins, draws, losses)) of the canonical position with the given hash.
+        """
+        return self.positions.get(h, [])
+
+
+class BinaryBook(Book):
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not a compiled opening book'.format(path))
+
+    @classmethod
+    def open(cls, path):
+        """Opens a compiled book, or returns None if there is none at the given path.
+        """
+        if not os.path.isfile(path):
+            return None
+        return cls(path)
+
+    def __getstate__(self):
+        # The players are pickled when they are handed over to the game runner, so the mapping is reopened instead.
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def _hash_at(self, index):
+        return struct.unpack_from('<Q', self.map, HEADER.size + index * RECORD.size)[0]
+
+    def lookup(self, h):
+        """
+        :return: A list of (move index, (games, wins, draws, losses)) of the canonical position with the given hash.
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._hash_at(middle) < h:
+                low = middle + 1
+            else:
+                high = middle
+        continuations = []
+        while low < self.count and self._hash_at(low) == h:
+            _, move, games, wins, draws, losses = RECORD.unpack_from(self.map, HEADER.size + low * RECORD.size)
+            continuations.append((move, (games, wins, draws, losses)))
+            low += 1
+        return continuations
+
+
+def _is_compiled_book(bin_path):
+    if not os.path.isfile(bin_path):
+        return False
+    with open(bin_path, 'rb') as bin_file:
+        return bin_file.read(len(MAGIC)) == MAGIC
+
+
+def open_book(gam_path, bin_path):
+    """Opens the compiled book, even if the text book changed since it was compiled: it is only recompiled offline.
+    Without a compiled book of the current format, the text book is parsed into a MemoryBook. Without either book, the
+    book is empty.
+    """
+    if _is_compiled_book(bin_path):
+        return BinaryBook(bin_path)
+    return MemoryBook.load(gam_path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Syntax: python3 -m Reversi.book book.gam book.bin')
+    else:
+        print('{} records written'.format(compile_book(sys.argv[1], sys.argv[2])))
@@ -0,0 +1,162 @@
+"""Compact binary game records.
+
+A game records file is a sequence of records, one per game, each made of:
+    a header     GAME_HEADER: marker, length of the rest of the record, player name lengths, number of moves, flags,
+                 setup time, time per k turns, k and the final X-O disc difference
+    the names    the x and o player module names, utf-8
+    the moves    one byte per move: x * 8 + y
+    move infos   MOVE_INFO per move: think time in seconds, nodes and depth of the player's search (0 when unknown)
+
+Every record is written with a single write call on a file opened for appending, so several processes can record
+games to the same file. The reader streams the file and only decodes the records it yields, so it iterates any
+number of games in constant memory.
+"""
+import struct
+
+from .board import GameState
+from .consts import BOARD_COLS, X_PLAYER, O_PLAYER
+
+MARKER = b'RG'
+GAME_HEADER = struct.Struct('<2sIBBBBffBb')
+# The start of GAME_HEADER, enough to find the end of the record
+_PREFIX = struct.Struct('<2sI')
+MOVE_INFO = struct.Struct('<fIB')
+
+# Flags
+X_EXCEEDED = 1
+O_EXCEEDED = 2
+SETUP_EXCEEDED = 4
+
+
+class GameRecord:
+    def __init__(self, x_player, o_player, setup_time, time_per_k_turns, k, moves, result, move_infos=None,
+                 exceeded=(), setup_exceeded=False):
+        """
+        :param x_player: The x player module name.
+        :param o_player: The o player module name.
+        :param moves: A list of (x, y).
+        :param result: The final X-O disc difference.
+        :param move_infos: A list of (think time, nodes, depth), one per move. Zeros when missing.
+        :param exceeded: The player types that exceeded their time.
+        :param setup_exceeded: Whether they exceeded it at setup.
+        """
+        self.players = {X_PLAYER: x_player, O_PLAYER: o_player}
+        self.setup_time = setup_time
+        self.time_per_k_turns = time_per_k_turns
+        self.k = k
+        self.moves = moves
+        self.result = result
+        self.move_infos = move_infos if move_infos is not None else [(0.0, 0, 0)] * len(moves)
+        self.exceeded = tuple(exceeded)
+        self.setup_exceeded = setup_exceeded
+
+    @classmethod
+    def from_result(cls, result, setup_time, time_per_k_turns, k):
+        """Builds the record of a game played by run_game.GameRunner.
+
+        :param result: The run_game.GameResult.
+        """
+        move_infos = []
+        for (_, run_time, _), search_info in zip(result.move_times, result.search_infos):
+            nodes, depth = search_info if search_info is not None else (0, 0)
+            move_infos.append((run_time, nodes, depth))
+        # A move returned after the player's time was up is timed but not played, so its info is dropped
+        move_infos = move_infos[:len(result.moves)]
+        assert len(move_infos) == len(result.moves), 'The game has moves without a time'
+        return cls(result.players[X_PLAYER], result.players[O_PLAYER], setup_time, time_per_k_turns, k,
+                   list(result.moves), result.discs[X_PLAYER] - result.discs[O_PLAYER], move_infos, result.exceeded,
+                   result.setup_exceeded)
+
+    def pack(self):
+        x_name = self.players[X_PLAYER].encode()
+        o_name = self.players[O_PLAYER].encode()
+        flags = ((X_EXCEEDED if X_PLAYER in self.exceeded else 0) | (O_EXCEEDED if O_PLAYER in self.exceeded else 0) |
+                 (SETUP_EXCEEDED if self.setup_exceeded else 0))
+        body = (x_name + o_name + bytes(x * BOARD_COLS + y for x, y in self.moves) +
+                b''.join(MOVE_INFO.pack(think_time, min(nodes, 0xFFFFFFFF), min(depth, 0xFF))
+                         for think_time, nodes, depth in self.move_infos))
+        length = GAME_HEADER.size - _PREFIX.size + len(body)
+        return GAME_HEADER.pack(MARKER, length, len(x_name), len(o_name), len(self.moves), flags, self.setup_time,
+                                self.time_per_k_turns, self.k, self.result) + body
+
+    @classmethod
+    def unpack(cls, data, with_infos=True):
+        """The inverse of pack.
+
+        :param with_infos: Whether to decode the move infos. Skipping them is faster when only the moves are needed.
+        """
+        marker, _, x_length, o_length, count, flags, setup_time, time_per_k_turns, k, result = \
+            GAME_HEADER.unpack_from(data, 0)
+        if marker != MARKER:
+            raise ValueError('Not a game record')
+        offset = GAME_HEADER.size
+        x_name = data[offset:offset + x_length].decode()
+        offset += x_length
+        o_name = data[offset:offset + o_length].decode()
+        offset += o_length
+        moves = [divmod(move, BOARD_COLS) for move in data[offset:offset + count]]
+        offset += count
+        move_infos = None
+        if with_infos:
+            move_infos = list(MOVE_INFO.iter_unpack(data[offset:offset + count * MOVE_INFO.size]))
+        exceeded = tuple(color for color, flag in ((X_PLAYER, X_EXCEEDED), (O_PLAYER, O_EXCEEDED)) if flags & flag)
+        return cls(x_name, o_name, setup_time, time_per_k_turns, k, moves, result, move_infos, exceeded,
+                   bool(flags & SETUP_EXCEEDED))
+
+    def positions(self):
+        """Replays the game.
+
+        :return: A generator of (the GameState before the move, the move) for every move. The same GameState is
+                 updated in place, so copy it to keep it.
+        """
+        state = GameState()
+        for x, y in self.moves:
+            yield state, (x, y)
+            state.perform_move(x, y)
+
+    def __repr__(self):
+        return '{} vs {}: {} moves, {:+d}'.format(self.players[X_PLAYER], self.players[O_PLAYER], len(self.moves),
+                                                 self.result)
+
+
+class GameRecordWriter:
+    def __init__(self, path):
+        """Appends game records to a file, creating it if needed.
+        """
+        self.file = open(path, 'ab', buffering=0)
+
+    def write(self, record):
+        self.file.write(record.pack())
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def append_game(path, record):
+    with GameRecordWriter(path) as writer:
+        writer.write(record)
+
+
+def read_games(path, with_infos=True):
+    """Streams the game records of a file.
+
+    :param with_infos: Whether to decode the move infos.
+    :return: A generator of GameRecord.
+    """
+    with open(path, 'rb') as games:
+        while True:
+            prefix = games.read(_PREFIX.size)
+            if len(prefix) < _PREFIX.size:
+                return
+            _, length = _PREFIX.unpack(prefix)
+            rest = games.read(length)
+            if len(rest) < length:
+                # A record cut short by a crash
+                return
+            yield GameRecord.unpack(prefix + rest, with_infos)
@@ -1,5 +1,6 @@
 """Abstract classes. Your classes must inherit from these.
 """
+from utils import WallClock
 
 
 class AbstractPlayer:
@@ -18,6 +19,15 @@ Like this: 'class Player(abstract.AbstractPlayer):'
         self.color = player_type
         self.time_per_k_turns = time_per_k_turns
         self.k = k
+        # (nodes, depth) of the search of the last move, or None if the move was not searched.
+        # Read by the game runner after every move, for the game records.
+        self.search_info = None
+        # The value the search found for the last move, in the player's own units, or None if the move was not
+        # searched. Used as a training label by datagen.py.
+        self.search_score = None
+        # The clock the player reads its time from. The game runner replaces it with its own after the setup, e.g.
+        # with a utils.VirtualClock, which the searches charge for every node.
+        self.time_source = WallClock()
 
     def get_move(self, game_state, possible_moves):
         """Chooses an action from the given actions.
@@ -28,6 +38,11 @@ Like this: 'class Player(abstract.AbstractPlayer):'
         """
         raise NotImplementedError
 
+    def stop(self):
+        """Called by the game runner when the game is over. Releases what the player holds, e.g. an engine process.
+        """
+        pass
+
     def __repr__(self):
         return self.color
 
@@ -0,0 +1,319 @@
+"""Performance regression benchmarks of the players, the search and the game state.
+
+The suite measures:
+    utility/<player>         utility evaluations per second of each player's evaluator, over the distinct positions up
+                             to 3 moves after the stored middlegame positions
+    search/<player>/nodes    the nodes of a fixed depth alpha-beta search of the stored middlegame positions
+    search/<player>/nps      the nodes per second of that search
+    state/deepcopy, state/snapshot, state/perform_move    GameState operations per second
+    game/simple_vs_random    the median wall time of a full game of simple_player against random_player
+
+A run is compared with a baseline file, and fails (exit status 1) when a measurement is worse than its baseline by
+more than its tolerance. The node counts are exact, so any increase fails; the timings are noisy and get a relative
+tolerance. A missing baseline file, or a measurement missing from it, fails too, so that a comparison cannot pass
+without checking anything. Baselines are machine specific: record them with --save on the machine that runs the
+comparisons.
+
+For example:
+    python3 benchmarks.py --save
+    python3 benchmarks.py
+    python3 benchmarks.py --only search state --tolerance 0.1
+"""
+import argparse
+import copy
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+
+from Reversi.board import GameState
+from Reversi.consts import X_PLAYER
+from run_game import play_game
+from utils import INFINITY, MiniMaxWithAlphaBetaPruning
+
+DEFAULT_BASELINE = 'benchmarks_baseline.json'
+
+# Middlegame positions, as the moves leading to them. Each has at least 4 legal moves.
+POSITIONS = [
+    'd6c4f3f6d3e6c6c7g6f4c8c5g3e7d8g7b5g5h6f7e8a5',
+    'e3f5d6c5f6f7b5a5f4f3g3c4g7h7d3f2c3h4a6e6f8b4',
+    'c5c6c7b5c4d7a6a4f4b3b7f5c3a8d6c8f6g5g6c2a5g3',
+    'f4f3c5g4e3c4d3c6h4f2b4g5b6a7f6b3e2b5c3c2f1g2',
+    'e3d3c5d6c3b4b5d2a3f6c4f4e7c6g5a6g3d7f2g7b7g4',
+    'e3f3c5c4b3b6c3e6b5f2b7c2f5g4d3a4e7f7g7d2c6c7',
+    'e3d3c3d2c5f3g3b4b3b2a3a5b1d6c4f2f1a2c2f5f6f7',
+    'e3f5c6c3e6f6g4e2e1f4b2h3f3d1g6c4b3f7g3c5h4e7',
+]
+
+# The players whose utility is measured, and those whose utility is searched
+UTILITY_PLAYERS = ['simple_player', 'better_player', 'min_max_player', 'alpha_beta_player', 'competition_player']
+SEARCH_PLAYERS = ['alpha_beta_player', 'competition_player']
+SEARCH_DEPTH = 3
+# The utility is measured on the positions up to this many moves after the stored ones
+UTILITY_PLIES = 3
+
+# The relative tolerance of the timed measurements
+TIME_TOLERANCE = 0.2
+
+
+class Measurement:
+    def __init__(self, name, value, unit, higher_is_better, tolerance):
+        """
+        :param tolerance: The relative change for the worse allowed against the baseline.
+        """
+        self.name = name
+        self.value = value
+        self.unit = unit
+        self.higher_is_better = higher_is_better
+        self.tolerance = tolerance
+
+    def regressed(self, baseline):
+        """
+        :param baseline: The baseline value of the measurement.
+        :return: True if the value is worse than the baseline by more than the tolerance.
+        """
+        if self.higher_is_better:
+            return self.value < baseline * (1 - self.tolerance)
+        return self.value > baseline * (1 + self.tolerance)
+
+    def to_dict(self):
+        return {'value': self.value, 'unit': self.unit, 'higher_is_better': self.higher_is_better,
+                'tolerance': self.tolerance}
+
+
+def parse_moves(moves):
+    """
+    :param moves: Move names, like 'd3c5'.
+    :return: The list of moves [x, y].
+    """
+    return [[int(moves[i + 1]) - 1, ord(moves[i]) - ord('a')] for i in range(0, len(moves), 2)]
+
+
+def positions():
+    states = []
+    for moves in POSITIONS:
+        state = GameState()
+        for x, y in parse_moves(moves):
+            assert state.perform_move(x, y), 'Illegal stored move in {}'.format(moves)
+        states.append(state)
+    return states
+
+
+def successor_positions(states, plies):
+    """
+    :return: The distinct positions up to the given number of moves after the given ones, the given ones included.
+    """
+    seen = set()
+    result = []
+    frontier = states
+    for ply in range(plies + 1):
+        next_frontier = []
+        for state in frontier:
+            key = (tuple(map(tuple, state.board)), state.curr_player)
+            if key in seen:
+                continue
+            seen.add(key)
+            result.append(state)
+            if ply < plies:
+                for move in state.get_possible_moves():
+                    next_state = copy.deepcopy(state)
+                    next_state.perform_move(move[0], move[1])
+                    next_frontier.append(next_state)
+        frontier = next_frontier
+    return result
+
+
+def make_player(name, color=X_PLAYER):
+    __import__('players.{}'.format(name))
+    return sys.modules['players.{}'.format(name)].Player(2, color, 10, 5)
+
+
+def rate(make_func, items, min_time, repeats=5):
+    """Calls a function on every item, again and again for at least min_time seconds, in repeats rounds. Like timeit,
+    the garbage collector is off while timing.
+
+    :param make_func: Returns the function to call, once per round and outside the timing, so that every round starts
+                      afresh, e.g. with a new player and empty caches.
+    :return: The calls per second of the fastest round.
+    """
+    best = 0.0
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            func = make_func()
+            calls = 0
+            start = time.perf_counter()
+            while True:
+                for item in items:
+                    func(item)
+                calls += len(items)
+                elapsed = time.perf_counter() - start
+                if elapsed >= min_time:
+                    break
+            best = max(best, calls / elapsed)
+    finally:
+        gc.enable()
+    return best
+
+
+def bench_utility(states, min_time):
+    # Thousands of distinct positions, so that a player caching its evaluations is measured evaluating them
+    states = successor_positions(states, UTILITY_PLIES)
+    for name in UTILITY_PLAYERS:
+        yield Measurement('utility/{}'.format(name), rate(lambda: make_player(name).utility, states, min_time),
+                          'evals/s', True, TIME_TOLERANCE)
+
+
+def bench_search(states):
+    for name in SEARCH_PLAYERS:
+        best_elapsed = None
+        nodes = 0
+        for _ in range(3):
+            nodes = 0
+            elapsed = 0.0
+            for state in states:
+                # A new player of the color to move, searching from its own point of view
+                player = make_player(name, state.curr_player)
+                alpha_beta = MiniMaxWithAlphaBetaPruning(player.utility, state.curr_player, lambda: False, False)
+                start = time.perf_counter()
+                alpha_beta.search(state, SEARCH_DEPTH, -INFINITY, INFINITY, True)
+                elapsed += time.perf_counter() - start
+                nodes += alpha_beta.nodes
+            best_elapsed = elapsed if best_elapsed is None else min(best_elapsed, elapsed)
+        yield Measurement('search/{}/nodes'.format(name), nodes, 'nodes', False, 0.0)
+        yield Measurement('search/{}/nps'.format(name), nodes / best_elapsed, 'nodes/s', True, TIME_TOLERANCE)
+
+
+def bench_state(states, min_time):
+    yield Measurement('state/deepcopy', rate(lambda: copy.deepcopy, states, min_time), 'copies/s', True,
+                      TIME_TOLERANCE)
+    yield Measurement('state/snapshot', rate(lambda: GameState.snapshot, states, min_time), 'snapshots/s', True,
+                      TIME_TOLERANCE)
+    # A played move cannot be played again, so each round plays the first legal move of every position on fresh
+    # copies, taken outside the timed loop
+    moves = [(state, state.get_possible_moves()[0]) for state in states]
+    best = 0.0
+    for _ in range(5):
+        copies = [(copy.deepcopy(state), move) for state, move in moves for _ in range(1000)]
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for state, move in copies:
+                state.perform_move(move[0], move[1])
+            best = max(best, len(copies) / (time.perf_counter() - start))
+        finally:
+            gc.enable()
+    yield Measurement('state/perform_move', best, 'moves/s', True, TIME_TOLERANCE)
+
+
+def bench_game(games):
+    times = []
+    for _ in range(games):
+        start = time.perf_counter()
+        play_game('simple_player', 'random_player', 2, 10, 5)
+        times.append(time.perf_counter() - start)
+    yield Measurement('game/simple_vs_random', statistics.median(times), 's', False, TIME_TOLERANCE)
+
+
+SUITES = ['utility', 'search', 'state', 'game']
+
+
+def run_benchmarks(suites=SUITES, min_time=0.5, games=5):
+    """
+    :param suites: The suites to run, out of SUITES.
+    :return: A list of Measurement.
+    """
+    states = positions()
+    benches = {
+        'utility': lambda: bench_utility(states, min_time),
+        'search': lambda: bench_search(states),
+        'state': lambda: bench_state(states, min_time),
+        'game': lambda: bench_game(games),
+    }
+    measurements = []
+    for suite in suites:
+        for measurement in benches[suite]():
+            measurements.append(measurement)
+            print('{:32} {:>14.6g} {}'.format(measurement.name, measurement.value, measurement.unit))
+    return measurements
+
+
+def load_baseline(path):
+    """
+    :return: A dict: measurement name -> its baseline dict, empty if the file is missing.
+    """
+    try:
+        with open(path, 'r') as baseline_file:
+            return json.load(baseline_file)['measurements']
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, measurements):
+    """Records the measurements in the baseline file, keeping the baselines of the measurements not run.
+    """
+    baseline = load_baseline(path)
+    baseline.update((measurement.name, measurement.to_dict()) for measurement in measurements)
+    with open(path, 'w') as baseline_file:
+        json.dump({'machine': platform.node(), 'python': platform.python_version(), 'measurements': baseline},
+                  baseline_file, indent=4, sort_keys=True)
+
+
+def compare(measurements, baseline, tolerance=None):
+    """Compares the measurements with their baselines, with the tolerances recorded in the baseline.
+
+    :param tolerance: Optional. Replaces the tolerance of the timed measurements.
+    :return: The list of the reports of the regressed measurements and of those without a baseline.
+    """
+    regressions = []
+    for measurement in measurements:
+        if measurement.name not in baseline:
+            report = '{}: no baseline, record one with --save'.format(measurement.name)
+            regressions.append(report)
+            print('MISSING    ' + report)
+            continue
+        measurement.tolerance = baseline[measurement.name]['tolerance']
+        if tolerance is not None and measurement.tolerance > 0:
+            measurement.tolerance = tolerance
+        base = baseline[measurement.name]['value']
+        change = (measurement.value - base) / base if base else 0.0
+        report = '{}: {:.6g} {} against {:.6g} ({:+.1%}, tolerance {:.0%})'.format(
+            measurement.name, measurement.value, measurement.unit, base, change, measurement.tolerance)
+        if measurement.regressed(base):
+            regressions.append(report)
+            print('REGRESSION ' + report)
+        else:
+            print('ok         ' + report)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the performance benchmarks and compares them with a baseline.')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='The baseline file.')
+    parser.add_argument('--save', action='store_true', help='Record this run as the baseline instead of comparing.')
+    parser.add_argument('--only', nargs='+', choices=SUITES, default=SUITES, help='The suites to run.')
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help='The relative tolerance of the timed measurements. Defaults to the baseline ones.')
+    parser.add_argument('--min-time', type=float, default=0.5, help='Seconds per round of a throughput measurement.')
+    parser.add_argument('--games', type=int, default=5, help='The games of the full game measurement.')
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline)
+    if not args.save and not baseline:
+        print('No baseline in {}: record one with --save before comparing'.format(args.baseline))
+        sys.exit(1)
+    measurements = run_benchmarks(args.only, args.min_time, args.games)
+    if args.save:
+        save_baseline(args.baseline, measurements)
+        print('Baseline saved to {}'.format(args.baseline))
+        return
+    regressions = compare(measurements, baseline, args.tolerance)
+    if regressions:
+        print('{} regressions or missing baselines'.format(len(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""Grows the opening book from our own self-play games.
+
+Every round:
+    1. The book's leaves are its frontier: the positions of fewer than --max-depth moves with fewer than --max-replies
+       replies explored. A book of full games has every line prefix continued, so a leaf is not a line end. The
+       leaves are scored from the point of view of the player who made their last move.
+    2. Leaves with fewer than --min-games games, or scoring at least --min-score, are expanded, the shallowest
+       --max-leaves of them: --games-per-leaf headless games are played from each of them, spread over a process
+       pool.
+    3. Every game appends to the text book the leaf, the move played after it and the game result. These
+       continuations are the next round's leaves, so lines that score well get deeper and bad ones stop growing.
+The win, draw and loss counts of every book node are those of the games recorded through it (see Reversi.book).
+
+After every round the book is compiled (see Reversi.book), by default next to the text book, since the players only
+read the compiled book when there is one and never compile it themselves.
+
+The tool can be interrupted at any time. Every book line is appended with a single write and synced, and a partial
+last line left by a crash is cut off when the tool starts. The round's games are planned in <book>.plan.json and every finished game is
+journaled in <book>.plan.done, so the next run resumes the round and skips the games already recorded.
+
+For example:
+    python3 book_expander.py Reversi/book.gam --rounds 3 --players simple_player better_player
+    python3 book_expander.py Reversi/book.gam --rounds 1 --compiled /tmp/book.bin
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+
+from Reversi import book
+from Reversi.board import GameState
+from Reversi.consts import X_PLAYER, O_PLAYER
+from tuning import make_player, self_play_game
+
+
+def plan_path(book_path):
+    return book_path + '.plan.json'
+
+
+def done_path(book_path):
+    return book_path + '.plan.done'
+
+
+def repair_book(book_path):
+    """Cuts off a partial last line, left by a crash in the middle of an append.
+    """
+    if not os.path.isfile(book_path):
+        return
+    with open(book_path, 'rb+') as gam:
+        text = gam.read()
+        if text and not text.endswith(b'\n'):
+            gam.truncate(text.rfind(b'\n') + 1)
+
+
+def read_book(book_path):
+    """
+    :return: A dict: every line prefix (tuple of moves) -> [games, first player wins, draws, first player losses, the
+             set of the replies played after it]
+    """
+    nodes = {(): [0, 0, 0, 0, set()]}
+    if not os.path.isfile(book_path):
+        return nodes
+    with open(book_path, 'r') as gam:
+        for line in gam:
+            parsed = book.parse_gam_line(line)
+            if parsed is None:
+                continue
+            moves, result = parsed
+            moves = tuple(moves)
+            for length in range(len(moves) + 1):
+                node = nodes.setdefault(moves[:length], [0, 0, 0, 0, set()])
+                node[0] += 1
+                if result is not None:
+                    node[1 if result > 0 else 3 if result < 0 else 2] += 1
+                if length < len(moves):
+                    node[4].add(moves[length])
+    return nodes
+
+
+def select_leaves(nodes, max_depth, max_replies, min_games, min_score, max_leaves):
+    """
+    :return: The frontier positions to expand, the shallowest first, at most max_leaves of them.
+    """
+    leaves = []
+    for moves, (games, wins, draws, losses, replies) in nodes.items():
+        if len(replies) >= max_replies or len(moves) >= max_depth:
+            continue
+        if len(moves) % 2 == 0:
+            # The second player made the last move
+            wins, losses = losses, wins
+        if games < min_games or book.score(games, wins, draws, losses) >= min_score:
+            leaves.append(moves)
+    return sorted(leaves, key=lambda moves: (len(moves), moves))[:max_leaves]
+
+
+def play_from_leaf(task):
+    """Runs in the pool. Plays one game from a leaf.
+
+    :return: A tuple: (the task index, the book line to record or None)
+    """
+    index, leaf, seed, players, time_per_move, noise, explore = task
+    rng = random.Random(seed)
+    x_name, o_name = players if rng.random() < 0.5 else reversed(players)
+    x_player = make_player(x_name, X_PLAYER, time_per_move, 1)
+    o_player = make_player(o_name, O_PLAYER, time_per_move, 1)
+
+    opening = list(leaf)
+    if rng.random() < explore:
+        # Branch out of the leaf with a random move, since the players alone would mostly repeat the same one.
+        state = GameState()
+        for x, y in leaf:
+            state.perform_move(x, y)
+        possible_moves = state.get_possible_moves()
+        if possible_moves:
+            opening.append(rng.choice(possible_moves))
+    _, moves, result = self_play_game(x_player, o_player, noise, rng, opening=opening)
+    if len(moves) <= len(leaf):
+        return index, None
+    return index, book.format_gam_line(moves[:len(leaf) + 1], result)
+
+
+def new_plan(args, round_number):
+    leaves = select_leaves(read_book(args.book), args.max_depth, args.max_replies, args.min_games, args.min_score,
+                           args.max_leaves)
+    rng = random.Random(args.seed + round_number if args.seed is not None else None)
+    plan = {
+        'round': round_number,
+        'tasks': [[list(map(list, leaf)), rng.getrandbits(32)] for leaf in leaves for _ in range(args.games_per_leaf)],
+    }
+    with open(plan_path(args.book), 'w') as plan_file:
+        json.dump(plan, plan_file)
+    open(done_path(args.book), 'w').close()
+    return plan
+
+
+def run_round(args, plan, pool):
+    done = set()
+    if os.path.isfile(done_path(args.book)):
+        with open(done_path(args.book), 'r') as done_file:
+            done = {int(line) for line in done_file if line.strip()}
+    tasks = [(index, [tuple(move) for move in leaf], seed, args.players, args.time, args.noise, args.explore)
+             for index, (leaf, seed) in enumerate(plan['tasks']) if index not in done]
+    print('round {}: {} games to play, {} already played'.format(plan['round'], len(tasks), len(done)))
+
+    gam = os.open(args.book, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        with open(done_path(args.book), 'a') as done_file:
+            for index, line in pool.imap_unordered(play_from_leaf, tasks):
+                # The line is written before the journal entry, so an interruption in between can only repeat one game.
+                if line is not None:
+                    os.write(gam, (line + '\n').encode())
+                    os.fsync(gam)
+                done_file.write('{}\n'.format(index))
+                done_file.flush()
+    finally:
+        os.close(gam)
+
+    os.remove(plan_path(args.book))
+    os.remove(done_path(args.book))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Grows the opening book from self-play games.')
+    parser.add_argument('book', help='The text book to grow. Created if missing.')
+    parser.add_argument('--rounds', type=int, default=1)
+    parser.add_argument('--games-per-leaf', type=int, default=8)
+    parser.add_argument('--max-depth', type=int, default=12)
+    parser.add_argument('--max-replies', type=int, default=3,
+                        help='Positions with fewer replies in the book are leaves.')
+    parser.add_argument('--max-leaves', type=int, default=100, help='The most leaves expanded per round.')
+    parser.add_argument('--min-games', type=int, default=4, help='Leaves with fewer games are always expanded.')
+    parser.add_argument('--min-score', type=float, default=0.45, help='The score needed to expand a leaf.')
+    parser.add_argument('--players', nargs=2, default=['simple_player', 'simple_player'])
+    parser.add_argument('--time', type=float, default=0.1, help='Seconds per move for the players.')
+    parser.add_argument('--noise', type=float, default=0.1)
+    parser.add_argument('--explore', type=float, default=0.5,
+                        help='The probability of playing a random move right after the leaf.')
+    parser.add_argument('--processes', type=int, default=None, help='Defaults to the number of cores.')
+    parser.add_argument('--compiled', default=None,
+                        help='Where to compile the book after every round. Defaults to the book path with .bin.')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    repair_book(args.book)
+    with multiprocessing.Pool(args.processes) as pool:
+        for round_number in range(1, args.rounds + 1):
+            if os.path.isfile(plan_path(args.book)):
+                with open(plan_path(args.book), 'r') as plan_file:
+                    plan = json.load(plan_file)
+            else:
+                plan = new_plan(args, round_number)
+            run_round(args, plan, pool)
+            compiled = args.compiled or os.path.splitext(args.book)[0] + '.bin'
+            print('{} records compiled'.format(book.compile_book(args.book, compiled)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Generates datasets of labelled positions from self-play, larger than memory if needed.
+
+The games are played headless on a process pool, with the players' moves replaced by random ones with probability
+--noise. Every position is streamed to fixed-size .npy shards written through memory maps, so the generator never
+holds more than one game per worker. A record holds:
+    planes  uint8 (2, 8, 8): the X discs and the O discs, indexed [plane][x][y] like GameState.board
+    side    the player to move: 0 for X, 1 for O
+    result  the final X-O disc difference
+    score   the search_score of the player who moved from the position, in its own units, NaN when it did not search
+
+The shards are read back memory-mapped, without loading them, by read_shards and iter_batches.
+
+For example:
+    python3 datagen.py data/ --games 10000 --players competition_player alpha_beta_player --noise 0.1
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import random
+
+import numpy as np
+
+from Reversi.consts import X_PLAYER, O_PLAYER
+from tuning import make_player, self_play_game
+
+
+def record_dtype():
+    return np.dtype([('planes', 'u1', (2, 8, 8)), ('side', 'u1'), ('result', 'i1'), ('score', '<f4')])
+
+
+def shard_path(directory, index):
+    return os.path.join(directory, 'shard-{:05d}.npy'.format(index))
+
+
+def bits_to_planes(bits):
+    """
+    :param bits: uint64 array of N bitboards.
+    :return: uint8 array of shape (N, 8, 8), indexed [x][y].
+    """
+    bits = np.ascontiguousarray(bits, dtype='<u8')
+    return np.unpackbits(bits.view(np.uint8), bitorder='little').reshape(len(bits), 8, 8)
+
+
+def play_game(task):
+    """Runs in the pool. Plays one game.
+
+    :return: The game's records, a structured array of record_dtype.
+    """
+    seed, players, time_per_move, noise = task
+    rng = random.Random(seed)
+    x_name, o_name = players if rng.random() < 0.5 else reversed(players)
+    x_player = make_player(x_name, X_PLAYER, time_per_move, 1)
+    o_player = make_player(o_name, O_PLAYER, time_per_move, 1)
+    scores = []
+    positions, _, result = self_play_game(x_player, o_player, noise, rng, scores=scores)
+
+    records = np.zeros(len(positions), dtype=record_dtype())
+    if positions:
+        x_bits, o_bits, side = (np.array(column, dtype=np.uint64) for column in zip(*positions))
+        records['planes'][:, 0] = bits_to_planes(x_bits)
+        records['planes'][:, 1] = bits_to_planes(o_bits)
+        records['side'] = side
+    records['result'] = result
+    records['score'] = [np.nan if score is None else score for score in scores]
+    return records
+
+
+class ShardWriter:
+    def __init__(self, directory, shard_size):
+        """Writes records to numbered shards of shard_size records, through memory maps. The shard numbers continue
+        after the shards already in the directory.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.shard_size = shard_size
+        self.index = len(glob.glob(os.path.join(directory, 'shard-*.npy')))
+        self.shard = None
+        self.count = 0
+
+    def write(self, records):
+        while len(records):
+            if self.shard is None:
+                self.shard = np.lib.format.open_memmap(shard_path(self.directory, self.index) + '.tmp', mode='w+',
+                                                       dtype=record_dtype(), shape=(self.shard_size,))
+                self.count = 0
+            written = min(len(records), self.shard_size - self.count)
+            self.shard[self.count:self.count + written] = records[:written]
+            self.count += written
+            records = records[written:]
+            if self.count == self.shard_size:
+                self.finish_shard()
+
+    def finish_shard(self):
+        temp_path = shard_path(self.directory, self.index) + '.tmp'
+        if self.count < self.shard_size:
+            # The last shard is cut to its records, so every shard holds only real positions
+            last = np.lib.format.open_memmap(shard_path(self.directory, self.index), mode='w+', dtype=record_dtype(),
+                                             shape=(self.count,))
+            last[:] = self.shard[:self.count]
+            last.flush()
+            del last
+            del self.shard
+            os.remove(temp_path)
+        else:
+            self.shard.flush()
+            del self.shard
+            os.replace(temp_path, shard_path(self.directory, self.index))
+        self.shard = None
+        self.index += 1
+
+    def close(self):
+        if self.shard is not None:
+            self.finish_shard()
+
+
+def read_shards(directory):
+    """
+    :return: A list of the shards of a directory, as read-only memory-mapped arrays.
+    """
+    return [np.load(path, mmap_mode='r') for path in sorted(glob.glob(os.path.join(directory, 'shard-*.npy')))]
+
+
+def iter_batches(directory, batch_size):
+    """Yields the records of a directory's shards in batches, copied into memory one batch at a time.
+    """
+    for shard in read_shards(directory):
+        for start in range(0, len(shard), batch_size):
+            yield np.array(shard[start:start + batch_size])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generates labelled positions from self-play games.')
+    parser.add_argument('directory', help='The shards directory. New shards are added after the existing ones.')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--players', nargs=2, default=['simple_player', 'simple_player'])
+    parser.add_argument('--time', type=float, default=0.1, help='Seconds per move for the players.')
+    parser.add_argument('--noise', type=float, default=0.1)
+    parser.add_argument('--shard-size', type=int, default=1 << 20, help='The number of records per shard.')
+    parser.add_argument('--processes', type=int, default=None, help='Defaults to the number of cores.')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    tasks = [(rng.getrandbits(32), args.players, args.time, args.noise) for _ in range(args.games)]
+    writer = ShardWriter(args.directory, args.shard_size)
+    positions = 0
+    with multiprocessing.Pool(args.processes) as pool:
+        for game, records in enumerate(pool.imap_unordered(play_game, tasks), 1):
+            writer.write(records)
+            positions += len(records)
+            if game % 100 == 0:
+                print('{} games, {} positions'.format(game, positions))
+    writer.close()
+    print('{} positions written'.format(positions))
+
+
+if __name__ == '__main__':
+    main()
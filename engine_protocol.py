@@ -0,0 +1,581 @@
+"""A line based engine protocol, in the style of GTP, so that engines can play through GameRunner across processes.
+
+A controller sends one command per line, optionally preceded by a numeric id, and the engine answers '= result' or
+'? error message' (prefixed by the same id), followed by an empty line. Colors are X and O, and moves are named by
+column letter and row number, like 'd3'. The commands are:
+    protocol_version, name, known_command <command>, list_commands, quit
+    set_time <time per k turns> <k>    the time control
+    time_left <seconds>                the time of the next moves of the server's searches, instead of the time per
+                                       k turns / k
+    clear_board                        back to the starting position
+    setboard <board> <color>           64 characters of X, O or - for empty, in board[x][y] order, and the player to move
+    play <color> <move>
+    genmove <color>                    searches, plays and answers a move
+    analyze <color>                    searches without playing, and answers '<move> nodes <n> depth <d> score <s>'
+    showboard, final_score
+
+This module is the engine side for the players of this repository, over stdin/stdout or as an asyncio server hosting
+any number of connections, one independent game each. The stdin engine keeps one player per color over the game,
+created with the set_time time control, so the player manages its time and keeps its caches like under GameRunner.
+The server instead runs every search with a fresh player of the time_left seconds, so that it can spread the searches
+of all its connections over a process pool; the trade-off is that its players keep nothing from one move to the next.
+The time a search waits in the pool's queue is taken out of its time, down to MIN_SEARCH_TIME, so with more busy
+connections than processes the moves get shorter, and can still come too late for the controller's deadline.
+It is also the controller side: ExternalPlayer is a player that drives an engine process or an engine server through
+the protocol (see players/external_player).
+
+For example:
+    python3 engine_protocol.py engine competition_player
+    python3 engine_protocol.py serve competition_player --port 7420 --processes 4
+    REVERSI_ENGINE=tcp://127.0.0.1:7420 python3 run_game.py 2 10 5 n external_player alpha_beta_player
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import itertools
+import os
+import selectors
+import shlex
+import socket
+import subprocess
+import sys
+import time
+
+import abstract
+from Reversi.board import GameState
+from Reversi.consts import BOARD_COLS, BOARD_ROWS, EM, X_PLAYER, O_PLAYER
+from tuning import make_player
+
+PROTOCOL_VERSION = '1'
+DEFAULT_PORT = 7420
+
+# The seconds the controller waits for the answer of a command other than a search, and beyond the time of a search
+COMMAND_TIMEOUT = 10.0
+SEARCH_TIMEOUT_MARGIN = 1.0
+# The least seconds a server search gets, however long it waited in the pool's queue
+MIN_SEARCH_TIME = 0.15
+
+COMMANDS = ['protocol_version', 'name', 'known_command', 'list_commands', 'quit', 'set_time', 'time_left',
+            'clear_board', 'setboard', 'play', 'genmove', 'analyze', 'showboard', 'final_score']
+SEARCH_COMMANDS = ('genmove', 'analyze')
+
+# The board text character of every square value
+SQUARE_CHARS = {X_PLAYER: X_PLAYER, O_PLAYER: O_PLAYER, EM: '-'}
+
+
+class ProtocolError(Exception):
+    """An invalid command, answered with '?'.
+    """
+    pass
+
+
+class EngineError(RuntimeError):
+    """Raised by the controller side when the engine fails or answers with an error.
+    """
+    pass
+
+
+def move_name(move):
+    return '{}{}'.format(chr(ord('a') + move[1]), move[0] + 1)
+
+
+def parse_move(name):
+    """
+    :return: The move [x, y].
+    :raises ProtocolError: If the name is not a square of the board.
+    """
+    if len(name) != 2 or not 'a' <= name[0].lower() < chr(ord('a') + BOARD_ROWS) or \
+            not '1' <= name[1] <= str(BOARD_COLS):
+        raise ProtocolError('invalid move {}'.format(name))
+    return [int(name[1]) - 1, ord(name[0].lower()) - ord('a')]
+
+
+def parse_color(name):
+    color = name.upper()
+    if color not in (X_PLAYER, O_PLAYER):
+        raise ProtocolError('invalid color {}'.format(name))
+    return color
+
+
+def board_text(state):
+    return ''.join(SQUARE_CHARS[state.board[x][y]] for x in range(BOARD_COLS) for y in range(BOARD_ROWS))
+
+
+def parse_board(text, color):
+    """
+    :return: The GameState of a setboard board text and player to move.
+    """
+    squares = {char: value for value, char in SQUARE_CHARS.items()}
+    if len(text) != BOARD_COLS * BOARD_ROWS or any(char not in squares for char in text):
+        raise ProtocolError('invalid board')
+    state = GameState()
+    state.board = [[squares[text[x * BOARD_ROWS + y]] for y in range(BOARD_ROWS)] for x in range(BOARD_COLS)]
+    state.curr_player = parse_color(color)
+    state.refresh_moves()
+    return state
+
+
+def search_position(task):
+    """Searches a position with a fresh player. Runs in the server's pool.
+
+    :param task: (player module name, board text, the player to move, the seconds for the move, the time.time() the
+                 task was made at)
+    :return: A tuple: (the move, the player's search_info, its search_score)
+    """
+    player_name, text, color, seconds, created = task
+    # The time waited in the pool's queue is part of the controller's deadline
+    seconds = max(seconds - (time.time() - created), MIN_SEARCH_TIME)
+    state = parse_board(text, color)
+    player = make_player(player_name, color, seconds, 1)
+    move = player.get_move(state.snapshot(), state.get_possible_moves())
+    return move, player.search_info, player.search_score
+
+
+class EngineSession:
+    def __init__(self, player_name):
+        """The game and settings of one controller connection, answering its commands. The search commands are split
+        in search_task and search_result, so that the search itself can run elsewhere.
+
+        :param player_name: The player module that searches.
+        """
+        self.player_name = player_name
+        self.state = GameState()
+        self.time_per_k_turns = 10.0
+        self.k = 5
+        # The seconds of the next moves of a search_position, or None for time per k turns / k
+        self.time_left = None
+        # The players of the searches in this process, by color, until the time control or the game changes
+        self.players = {}
+        self.quit = False
+
+    @staticmethod
+    def parse(line):
+        """
+        :return: A tuple: (the command id or '', the command, its arguments), or None for an empty line or a comment.
+        """
+        words = line.split('#', 1)[0].split()
+        if not words:
+            return None
+        command_id = ''
+        if words[0].isdigit():
+            command_id = words.pop(0)
+        if not words:
+            return None
+        return command_id, words[0], words[1:]
+
+    def execute(self, command, args):
+        """Runs a command other than a search.
+
+        :return: The answer text.
+        :raises ProtocolError: If the command or its arguments are invalid.
+        """
+        try:
+            if command == 'protocol_version':
+                return PROTOCOL_VERSION
+            if command == 'name':
+                return self.player_name
+            if command == 'known_command':
+                return 'true' if args[0] in COMMANDS else 'false'
+            if command == 'list_commands':
+                return '\n'.join(COMMANDS)
+            if command == 'quit':
+                self.quit = True
+                return ''
+            if command == 'set_time':
+                time_per_k_turns, k = float(args[0]), int(args[1])
+                if k <= 0:
+                    raise ProtocolError('k must be positive')
+                self.time_per_k_turns, self.k = time_per_k_turns, k
+                self.stop_players()
+                return ''
+            if command == 'time_left':
+                self.time_left = float(args[0])
+                return ''
+            if command == 'clear_board':
+                self.state = GameState()
+                self.stop_players()
+                return ''
+            if command == 'setboard':
+                self.state = parse_board(args[0], args[1])
+                return ''
+            if command == 'play':
+                self.play(parse_color(args[0]), parse_move(args[1]))
+                return ''
+            if command == 'showboard':
+                return '\n'.join(''.join(SQUARE_CHARS[self.state.board[x][y]] for y in range(BOARD_ROWS))
+                                 for x in range(BOARD_COLS)) + '\n{} to move'.format(self.state.curr_player)
+            if command == 'final_score':
+                text = board_text(self.state)
+                difference = text.count(X_PLAYER) - text.count(O_PLAYER)
+                if difference == 0:
+                    return '0'
+                return '{}+{}'.format(X_PLAYER if difference > 0 else O_PLAYER, abs(difference))
+        except (IndexError, ValueError):
+            raise ProtocolError('invalid arguments')
+        raise ProtocolError('unknown command')
+
+    def play(self, color, move):
+        if color != self.state.curr_player:
+            raise ProtocolError('{} is not to move'.format(color))
+        if move not in self.state.get_possible_moves():
+            raise ProtocolError('illegal move')
+        self.state.perform_move(move[0], move[1])
+
+    def search_task(self, command, args):
+        """
+        :return: The search_position task of a search command.
+        """
+        if not args:
+            raise ProtocolError('invalid arguments')
+        color = parse_color(args[0])
+        if color != self.state.curr_player:
+            raise ProtocolError('{} is not to move'.format(color))
+        if not self.state.get_possible_moves():
+            raise ProtocolError('no legal move')
+        seconds = self.time_left if self.time_left is not None else self.time_per_k_turns / self.k
+        return self.player_name, board_text(self.state), color, seconds, time.time()
+
+    def search(self, task):
+        """Runs a search_task in this process, with the session's player of the color to move. The player is created
+        with the set_time time control on its first search.
+
+        :return: Like search_position.
+        """
+        color = task[2]
+        player = self.players.get(color)
+        if player is None:
+            player = self.players[color] = make_player(self.player_name, color, self.time_per_k_turns, self.k)
+        move = player.get_move(self.state.snapshot(), self.state.get_possible_moves())
+        return move, player.search_info, player.search_score
+
+    def stop_players(self):
+        for player in self.players.values():
+            player.stop()
+        self.players = {}
+
+    def search_result(self, command, task, result):
+        """
+        :return: The answer text of a search command, given the search_position result. genmove plays the move.
+        """
+        move, search_info, search_score = result
+        if command == 'genmove':
+            self.play(task[2], move)
+            return move_name(move)
+        nodes, depth = search_info if search_info is not None else (0, 0)
+        return '{} nodes {} depth {} score {}'.format(move_name(move), nodes, depth,
+                                                      'none' if search_score is None else search_score)
+
+
+def format_answer(command_id, text, error=False):
+    return '{}{} {}\n\n'.format('?' if error else '=', command_id, text).replace(' \n\n', '\n\n')
+
+
+def answer_line(session, line):
+    """Answers a command line, searching in this process with the session's players.
+
+    :return: The answer, or None for an empty line.
+    """
+    request = session.parse(line)
+    if request is None:
+        return None
+    command_id, command, args = request
+    try:
+        if command in SEARCH_COMMANDS:
+            task = session.search_task(command, args)
+            text = session.search_result(command, task, session.search(task))
+        else:
+            text = session.execute(command, args)
+    except ProtocolError as e:
+        return format_answer(command_id, e, error=True)
+    except Exception as e:
+        return format_answer(command_id, 'internal error: {}'.format(e), error=True)
+    return format_answer(command_id, text)
+
+
+def run_engine(player_name):
+    """The engine loop over stdin/stdout, until 'quit' or the end of the input. What the players print goes to stderr,
+    so that stdout only carries the answers.
+    """
+    session = EngineSession(player_name)
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        for line in sys.stdin:
+            answer = answer_line(session, line)
+            if answer is not None:
+                stdout.write(answer)
+                stdout.flush()
+            if session.quit:
+                break
+    finally:
+        session.stop_players()
+        sys.stdout = stdout
+
+
+async def serve_connection(reader, writer, player_name, executor):
+    session = EngineSession(player_name)
+    loop = asyncio.get_running_loop()
+    try:
+        while not session.quit:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = session.parse(line.decode())
+            except UnicodeDecodeError:
+                writer.write(format_answer('', 'invalid command encoding', error=True).encode())
+                await writer.drain()
+                continue
+            if request is None:
+                continue
+            command_id, command, args = request
+            try:
+                if command in SEARCH_COMMANDS:
+                    task = session.search_task(command, args)
+                    result = await loop.run_in_executor(executor, search_position, task)
+                    answer = format_answer(command_id, session.search_result(command, task, result))
+                else:
+                    answer = format_answer(command_id, session.execute(command, args))
+            except ProtocolError as e:
+                answer = format_answer(command_id, e, error=True)
+            except Exception as e:
+                # e.g. a player exception or a broken pool. The controller gets an answer instead of waiting for none.
+                answer = format_answer(command_id, 'internal error: {}'.format(e), error=True)
+            writer.write(answer.encode())
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(player_name, host='127.0.0.1', port=DEFAULT_PORT, processes=None):
+    """Serves connections until cancelled, each one an independent game. The searches of all the connections run on
+    a process pool.
+    """
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        server = await asyncio.start_server(
+            lambda reader, writer: serve_connection(reader, writer, player_name, executor), host, port)
+        async with server:
+            await server.serve_forever()
+
+
+class EngineClient:
+    def __init__(self, engine):
+        """The controller side of a connection to an engine.
+
+        :param engine: A command line starting an engine on stdin/stdout, or tcp://host:port for an engine server.
+        """
+        self.process = None
+        self.connection = None
+        if engine.startswith('tcp://'):
+            host, port = engine[len('tcp://'):].rsplit(':', 1)
+            # The timeout bounds the sends. The answers are waited for with the selector and their own timeout.
+            self.connection = socket.create_connection((host, int(port)), COMMAND_TIMEOUT)
+            self.input = self.connection
+        else:
+            self.process = subprocess.Popen(shlex.split(engine), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self.input = self.process.stdout
+        # The answers are read through a selector rather than a file's readline, so that a read can time out
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.input, selectors.EVENT_READ)
+        self.buffer = b''
+        self.closed = False
+
+    def send(self, command, timeout=COMMAND_TIMEOUT):
+        """
+        :param timeout: The seconds to wait for the answer. The connection is closed if the answer is late, so that it
+                        cannot be taken for the answer of a later command.
+        :return: The answer text.
+        :raises EngineError: If the engine answers with an error, is late or is gone.
+        """
+        if not self.write(command):
+            self.abort()
+            raise EngineError('The engine is gone')
+        deadline = time.monotonic() + timeout
+        lines = []
+        while True:
+            line = self.read_line(deadline)
+            if line is None and self.closed:
+                raise EngineError('The engine is gone')
+            if line is None:
+                self.abort()
+                raise EngineError('The engine did not answer {} in {} seconds'.format(command, timeout))
+            line = line.rstrip('\r\n')
+            if not line:
+                if lines:
+                    break
+                continue
+            lines.append(line)
+        text = '\n'.join(lines)
+        if text.startswith('?'):
+            raise EngineError('{} failed: {}'.format(command, text[1:].strip()))
+        if not text.startswith('='):
+            raise EngineError('Invalid answer to {}: {}'.format(command, text))
+        return text[1:].strip()
+
+    def write(self, command):
+        """
+        :return: False if the engine is gone.
+        """
+        if self.closed:
+            return False
+        try:
+            if self.connection is not None:
+                self.connection.sendall((command + '\n').encode())
+            else:
+                self.process.stdin.write((command + '\n').encode())
+                self.process.stdin.flush()
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def read_line(self, deadline):
+        """
+        :return: The next answer line, or None if it did not come before the deadline (a time.monotonic() time).
+        :raises EngineError: If the engine is gone.
+        """
+        while b'\n' not in self.buffer:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0 or not self.selector.select(remaining):
+                    return None
+                if self.connection is not None:
+                    data = self.connection.recv(4096)
+                else:
+                    data = os.read(self.input.fileno(), 4096)
+            except (OSError, ValueError):
+                # Also when the connection was closed by another thread, e.g. by stop() after the player's time is up
+                data = b''
+            if not data:
+                self.abort()
+                raise EngineError('The engine is gone')
+            self.buffer += data
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return line.decode()
+
+    def abort(self):
+        """Closes the connection without waiting for the engine.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.selector.close()
+        if self.connection is not None:
+            self.connection.close()
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            for pipe in (self.process.stdin, self.process.stdout):
+                try:
+                    pipe.close()
+                except OSError:
+                    pass
+
+    def close(self):
+        """Sends quit and closes the connection. No answer is read, so that a late answer of a search still running in
+        another thread is not taken for the answer of quit.
+        """
+        if self.write('quit') and self.process is not None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(1)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        self.abort()
+
+
+# The open engine clients, by key. A player holds the key of its client rather than the client, so that it stays
+# picklable (the thread backend passes the players through a queue after their setup).
+_clients = {}
+_client_keys = itertools.count()
+
+
+class ExternalPlayer(abstract.AbstractPlayer):
+    # The engine: a command line or tcp://host:port. Also set by the REVERSI_ENGINE environment variable.
+    engine = os.environ.get('REVERSI_ENGINE')
+
+    def __init__(self, setup_time, player_color, time_per_k_turns, k):
+        """A player whose moves are searched by an external engine, through the engine protocol. The engine is given
+        the board before every move, so it does not need to follow the game.
+        """
+        abstract.AbstractPlayer.__init__(self, setup_time, player_color, time_per_k_turns, k)
+        if not self.engine:
+            raise ValueError('No engine: set ExternalPlayer.engine or REVERSI_ENGINE')
+        self.clock = self.time_source.time()
+        # We are simply providing (remaining time / remaining turns) for each turn in round.
+        # Taking a spare time of 0.05 seconds.
+        self.turns_remaining_in_round = self.k
+        self.time_remaining_in_round = self.time_per_k_turns
+        self.time_for_current_move = self.time_remaining_in_round / self.turns_remaining_in_round - 0.05
+        self.client_key = next(_client_keys)
+        _clients[self.client_key] = EngineClient(self.engine)
+        self.client.send('set_time {} {}'.format(time_per_k_turns, k))
+        self.engine_name = self.client.send('name')
+
+    @property
+    def client(self):
+        return _clients[self.client_key]
+
+    def get_move(self, game_state, possible_moves):
+        self.clock = self.time_source.time()
+        self.time_for_current_move = self.time_remaining_in_round / self.turns_remaining_in_round - 0.05
+
+        if len(possible_moves) == 1:
+            best_move = possible_moves[0]
+        else:
+            self.client.send('time_left {:.3f}'.format(self.time_for_current_move))
+            self.client.send('setboard {} {}'.format(board_text(game_state), game_state.curr_player))
+            # A late answer closes the connection, so the game cannot hang on the engine
+            answer = self.client.send('genmove {}'.format(game_state.curr_player),
+                                      max(self.time_for_current_move, 0) + SEARCH_TIMEOUT_MARGIN)
+            try:
+                best_move = parse_move(answer)
+            except ProtocolError:
+                best_move = None
+            if best_move not in possible_moves:
+                raise EngineError('The engine played the illegal move {}'.format(answer))
+
+        if self.turns_remaining_in_round == 1:
+            self.turns_remaining_in_round = self.k
+            self.time_remaining_in_round = self.time_per_k_turns
+        else:
+            self.turns_remaining_in_round -= 1
+            self.time_remaining_in_round -= (self.time_source.time() - self.clock)
+
+        return best_move
+
+    def stop(self):
+        client = _clients.pop(self.client_key, None)
+        if client is not None:
+            client.close()
+
+    def __repr__(self):
+        return '{} external {}'.format(abstract.AbstractPlayer.__repr__(self), self.engine_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs a player as an engine speaking the engine protocol.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    engine_parser = commands.add_parser('engine', help='Answer the commands of stdin on stdout.')
+    engine_parser.add_argument('player', help='The player module.')
+
+    serve_parser = commands.add_parser('serve', help='Serve any number of connections with asyncio.')
+    serve_parser.add_argument('player', help='The player module.')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument('--processes', type=int, default=None,
+                              help='The search processes. Defaults to the number of cores.')
+    args = parser.parse_args()
+
+    if args.command == 'engine':
+        run_engine(args.player)
+    else:
+        try:
+            asyncio.run(serve(args.player, args.host, args.port, args.processes))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,76 +1,11 @@
-import os
-import re
-import threading
-from subprocess import call
-
 from matplotlib import pyplot as plt
 
-players = ['simple_player', 'alpha_beta_player', 'min_max_player', 'better_player']
-times = ['2', '10', '50']
-
-maxthreads = 15
-semaphore = threading.Semaphore(value=maxthreads)
-threads = list()
-
-def callto(time, p1, p2):
-    semaphore.acquire()
-    file_name = 'temp/' + p1 + p2+time+'.txt'
-
-    file = open(file_name, 'w+')
-
-    for _ in range(5):
-        print('python3 run_game.py 2 {} 5 n {} {}'.format(time, p1, p2))
-        call(['python3', 'run_game.py', '2', time, '5', 'n', p1, p2], stdout=file)
-
-    file.close()
-
-    semaphore.release()
+from tournament import DEFAULT_PLAYERS, DEFAULT_TIMES, ResultsStore, run_tournament
 
+players = DEFAULT_PLAYERS
+times = DEFAULT_TIMES
 
-def run_threads():
-    threads = []
-
-    for p1 in players:
-        for p2 in players:
-            if p1 == p2:
-                continue
-            for time in times:
-                t = threading.Thread(target=callto, args=[time, p1, p2])
-                threads.append(t)
-                t.start()
-
-    for t in threads:
-        t.join()
-
-
-def create_fianl_reult_and_csv_file():
-    final_result = {player: {t: 0 for t in times} for player in players}
-    final = open('final.csv', 'w')
-    for p1 in players:
-        for p2 in players:
-            if p1 == p2:
-                continue
-            for time in times:
-                file_name = 'temp/' + p1 + p2+time+'.txt'
-                with open(file_name, 'r') as file:
-                    for line in file.readlines():
-                        print('line is:{}'.format(line))
-                        winner = re.split('\n', line)[0].split(' ')[-1] + "_player"
-                        p1_score = '0.5'
-                        p2_score = '0.5'
-                        if winner == p1:
-                            p1_score = '1'
-                            p2_score = '0'
-                        elif winner == p2:
-                            p1_score = '0'
-                            p2_score = '1'
-                        final_result[p1][time] += float(p1_score)
-                        final_result[p2][time] += float(p2_score)
-                        line_to_print = p1 + ',' + p2 + ',' + time + ',' + p1_score + ',' + p2_score + '\n'
-                        final.write(line_to_print)
-
-    final.close()
-    return final_result
+results_path = 'results.jsonl'
 
 
 def create_graph_and_final_table(final_result):
@@ -96,11 +31,10 @@ def create_graph_and_final_table(final_result):
 
 def main():
 
-    # if not os.path.isdir('temp'):
-    #     os.mkdir('temp')
-
-    # run_threads()
-    final_result = create_fianl_reult_and_csv_file()
+    store = ResultsStore(results_path)
+    # run_tournament(store, players, times, games=5)
+    store.write_games_csv('final.csv')
+    final_result = store.score_table(players, times)
     create_graph_and_final_table(final_result)
 
 
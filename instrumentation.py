@@ -0,0 +1,174 @@
+"""Move timing statistics and profiling of the players.
+
+The statistics are computed from game results (run_game.GameResult or its to_dict form), so they aggregate a single
+game, a tournament's results store or games played in other processes alike. For every player and game phase they
+hold a histogram of the move latencies, and for every player the share of the available time its moves used and the
+smallest time it had left after a move (its timeout margin).
+
+The profiles are written by GameRunner when it is given a profile directory, one cProfile file per player and game,
+and merged per player by hot_spots.
+"""
+import bisect
+import glob
+import io
+import os
+import pstats
+
+from Reversi.consts import BOARD_COLS, BOARD_ROWS, X_PLAYER, O_PLAYER
+from utils import INFINITY
+
+# The upper bounds of the latency buckets, in seconds. The last bucket has no bound.
+LATENCY_BOUNDS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10]
+
+# The game phases, by the number of empty squares before the move
+PHASES = ['opening', 'midgame', 'endgame']
+OPENING_EMPTIES = 44
+ENDGAME_EMPTIES = 20
+
+# The empty squares at the start of a game
+START_EMPTIES = BOARD_COLS * BOARD_ROWS - 4
+
+
+def phase(empties):
+    if empties > OPENING_EMPTIES:
+        return 'opening'
+    if empties > ENDGAME_EMPTIES:
+        return 'midgame'
+    return 'endgame'
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, latency):
+        self.buckets[bisect.bisect_left(LATENCY_BOUNDS, latency)] += 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def percentile(self, fraction):
+        """
+        :return: The upper bound of the bucket holding the given fraction of the latencies, or the maximum latency
+                 for the last bucket.
+        """
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BOUNDS, self.buckets):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max
+
+    def __repr__(self):
+        if not self.count:
+            return 'no moves'
+        return '{} moves, mean {:.3f}s, p50 <= {:g}s, p90 <= {:g}s, max {:.3f}s'.format(
+            self.count, self.total / self.count, self.percentile(0.5), self.percentile(0.9), self.max)
+
+
+class PlayerStats:
+    def __init__(self):
+        self.histograms = {name: LatencyHistogram() for name in PHASES}
+        # The sum of every move's time divided by the time it had, and the number of such moves
+        self.utilization_total = 0.0
+        self.utilization_count = 0
+        self.min_margin = None
+        self.timeouts = 0
+        # The nodes (or playouts) of the searched moves, and the time of these moves
+        self.nodes = 0
+        self.search_time = 0.0
+
+    def add_move(self, empties, latency, budget, search_info=None):
+        """
+        :param empties: The number of empty squares before the move.
+        :param latency: The move's wall time.
+        :param budget: The time the player had left for the move, or None if unknown.
+        :param search_info: The player's (nodes, depth) for the move, or None if it did not search.
+        """
+        self.histograms[phase(empties)].add(latency)
+        if search_info is not None:
+            self.nodes += search_info[0]
+            self.search_time += latency
+        if budget is not None and 0 < budget < INFINITY:
+            self.utilization_total += latency / budget
+            self.utilization_count += 1
+            margin = budget - latency
+            self.min_margin = margin if self.min_margin is None else min(self.min_margin, margin)
+
+    def report(self, name):
+        lines = ['{}:'.format(name)]
+        for phase_name in PHASES:
+            lines.append('    {}: {}'.format(phase_name, self.histograms[phase_name]))
+        if self.utilization_count:
+            lines.append('    budget utilization {:.0%}, timeout margin {:.3f}s, {} timeouts'.format(
+                self.utilization_total / self.utilization_count, self.min_margin, self.timeouts))
+        if self.search_time > 0:
+            lines.append('    {:.0f} nodes per second'.format(self.nodes / self.search_time))
+        return '\n'.join(lines)
+
+
+class GameStats:
+    """The move statistics of every player over a set of games.
+    """
+
+    def __init__(self):
+        self.players = {}
+
+    def add_result(self, result):
+        """
+        :param result: A run_game.GameResult or its to_dict form.
+        """
+        if not isinstance(result, dict):
+            result = result.to_dict()
+        names = {X_PLAYER: result['x_player'], O_PLAYER: result['o_player']}
+        budgets = result.get('budgets') or [None] * len(result['move_times'])
+        search_infos = result.get('search_infos') or [None] * len(result['move_times'])
+        # The moves and the move times are in the same order, and a move fills one square
+        for ply, ((color, latency, _), budget, search_info) in enumerate(zip(result['move_times'], budgets,
+                                                                             search_infos)):
+            self.player(names[color]).add_move(START_EMPTIES - ply, latency, budget, search_info)
+        if not result['setup_exceeded']:
+            for color in result['exceeded']:
+                self.player(names[color]).timeouts += 1
+
+    def player(self, name):
+        return self.players.setdefault(name, PlayerStats())
+
+    def report(self):
+        return '\n'.join(stats.report(name) for name, stats in sorted(self.players.items()))
+
+
+def profile_path(profile_dir, player_name):
+    """A new profile file name for one game of a player. Unique across processes. Creates the directory if needed.
+    """
+    os.makedirs(profile_dir, exist_ok=True)
+    index = 0
+    while True:
+        path = os.path.join(profile_dir, '{}.{}.{}.prof'.format(player_name, os.getpid(), index))
+        if not os.path.exists(path):
+            return path
+        index += 1
+
+
+def hot_spots(profile_dir, limit=20):
+    """Merges the profiles of every player in a directory.
+
+    :param limit: The number of functions listed per player.
+    :return: A dict: player name -> the report of its functions with the highest cumulative time.
+    """
+    paths = {}
+    for path in sorted(glob.glob(os.path.join(profile_dir, '*.prof'))):
+        paths.setdefault(os.path.basename(path).split('.')[0], []).append(path)
+    reports = {}
+    for player_name, player_paths in paths.items():
+        out = io.StringIO()
+        stats = pstats.Stats(*player_paths, stream=out)
+        # Otherwise the report starts with a line per profile file
+        stats.files = []
+        stats.sort_stats('cumulative').print_stats(limit)
+        reports[player_name] = out.getvalue()
+    return reports
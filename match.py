@@ -0,0 +1,187 @@
+"""Plays a match between two players until a sequential probability ratio test (SPRT) decides it.
+
+The test weighs H0: the player is elo0 stronger than the opponent, against H1: it is elo1 stronger. After every game
+the log likelihood ratio (LLR) of H1 to H0 is updated, and the match stops as soon as it leaves the bounds set by
+the error rates alpha (accepting H1 wrongly) and beta (accepting H0 wrongly). A clear difference is thus decided in a
+few games, and a close one gets as many as it needs, up to --max-games.
+
+The games are played on the tournament pool (see tournament.py) with colors alternating, and recorded in a results
+store, so an interrupted match resumes with the games already played.
+
+For example:
+    python3 match.py match.jsonl competition_player better_player --time 2 --elo0 0 --elo1 20
+"""
+import argparse
+import functools
+import math
+
+from tournament import ResultsStore, game_key, make_pool, play_task, record_points
+
+
+def expected_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo_from_score(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def score_statistics(wins, draws, losses):
+    """The variance is estimated with a prior of one win, one draw and one loss, so that it is never zero: when all
+    the games ended the same way it shrinks with the number of games instead of vanishing.
+
+    :return: A tuple: (the mean score per game, the variance of a game's score)
+    """
+    games = wins + draws + losses
+    mean = (wins + 0.5 * draws) / games
+    variance = ((wins + 1) * (1 - mean) ** 2 + (draws + 1) * (0.5 - mean) ** 2 + (losses + 1) * mean ** 2) / \
+        (games + 3)
+    return mean, variance
+
+
+def llr(wins, draws, losses, elo0, elo1):
+    """The log likelihood ratio of H1 to H0, in the normal approximation of the game scores.
+    """
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0
+    mean, variance = score_statistics(wins, draws, losses)
+    score0, score1 = expected_score(elo0), expected_score(elo1)
+    return games * (score1 - score0) * (2 * mean - score0 - score1) / (2 * variance)
+
+
+def llr_bounds(alpha, beta):
+    """
+    :return: A tuple: (the LLR accepting H0 at or below, the LLR accepting H1 at or above)
+    """
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def elo_interval(wins, draws, losses, z=1.96):
+    """
+    :return: A tuple: (the Elo difference, the lower and upper bounds of its confidence interval), 95% by default.
+    """
+    games = wins + draws + losses
+    mean, variance = score_statistics(wins, draws, losses)
+    margin = z * math.sqrt(variance / games)
+    return elo_from_score(mean), elo_from_score(mean - margin), elo_from_score(mean + margin)
+
+
+def match_tasks(player, opponent, time, max_games):
+    """The player plays x in the even games and o in the odd ones.
+
+    :return: A list of tournament tasks: (x player, o player, time, game index of the pairing)
+    """
+    return [(player, opponent, time, game // 2) if game % 2 == 0 else (opponent, player, time, game // 2)
+            for game in range(max_games)]
+
+
+class Match:
+    def __init__(self, player, opponent, elo0, elo1, alpha, beta):
+        """The running results of a match and its SPRT, from the point of view of 'player'.
+        """
+        self.player = player
+        self.opponent = opponent
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.lower, self.upper = llr_bounds(alpha, beta)
+        self.wins = self.draws = self.losses = 0
+
+    def add(self, record):
+        points = record_points(record)
+        if record['p2'] == self.player:
+            points = 1 - points
+        if points == 1:
+            self.wins += 1
+        elif points == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    def llr(self):
+        return llr(self.wins, self.draws, self.losses, self.elo0, self.elo1)
+
+    def decision(self):
+        """
+        :return: 'H1' if the player is at least elo1 stronger, 'H0' if at most elo0, None while undecided.
+        """
+        value = self.llr()
+        if value >= self.upper:
+            return 'H1'
+        if value <= self.lower:
+            return 'H0'
+        return None
+
+    def __repr__(self):
+        games = self.wins + self.draws + self.losses
+        text = '{} vs {}: {} games, +{} ={} -{}, LLR {:.2f} ({:.2f}, {:.2f})'.format(
+            self.player, self.opponent, games, self.wins, self.draws, self.losses, self.llr(), self.lower, self.upper)
+        if games:
+            elo, low, high = elo_interval(self.wins, self.draws, self.losses)
+            text += ', Elo {:+.1f} [{:+.1f}, {:+.1f}]'.format(elo, low, high)
+        return text
+
+
+def run_match(store, player, opponent, time, elo0=0, elo1=20, alpha=0.05, beta=0.05, max_games=1000,
+              processes=None, **game_options):
+    """Plays games until the SPRT is decided or max_games are played.
+
+    :param store: A ResultsStore. Its games of this match count, and the new ones are added to it.
+    :param game_options: setup_time, k and record_path, passed to tournament.play_task.
+    :return: The Match.
+    """
+    match = Match(player, opponent, elo0, elo1, alpha, beta)
+    tasks = match_tasks(player, opponent, str(time), max_games)
+    keys = {game_key(*task) for task in tasks}
+    for record in store:
+        if game_key(record['p1'], record['p2'], record['time'], record['game']) in keys:
+            match.add(record)
+    tasks = [task for task in tasks if game_key(*task) not in store]
+    if match.decision() is not None or not tasks:
+        return match
+
+    play = functools.partial(play_task, **game_options)
+    # Leaving the pool terminates the games still running once the match is decided
+    with make_pool(processes) as pool:
+        for record in pool.imap_unordered(play, tasks, chunksize=1):
+            store.add(record)
+            match.add(record)
+            print(match)
+            if match.decision() is not None:
+                break
+    return match
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plays a match until an SPRT on Elo bounds decides it.')
+    parser.add_argument('results', help='The JSON lines results file. The games already in it are not played again.')
+    parser.add_argument('player')
+    parser.add_argument('opponent')
+    parser.add_argument('--time', default='2', help='Seconds per k turns.')
+    parser.add_argument('--elo0', type=float, default=0, help='The Elo difference of H0.')
+    parser.add_argument('--elo1', type=float, default=20, help='The Elo difference of H1.')
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--max-games', type=int, default=1000)
+    parser.add_argument('--setup-time', type=float, default=2)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--processes', type=int, default=None, help='Defaults to the number of available cores.')
+    parser.add_argument('--records', default=None, help='Also append the games to this game records file.')
+    args = parser.parse_args()
+
+    match = run_match(ResultsStore(args.results), args.player, args.opponent, args.time, args.elo0, args.elo1,
+                      args.alpha, args.beta, args.max_games, args.processes, setup_time=args.setup_time, k=args.k,
+                      record_path=args.records)
+    print(match)
+    decision = match.decision()
+    if decision == 'H1':
+        print('H1 accepted: {} is stronger by at least {:g} Elo'.format(args.player, args.elo1))
+    elif decision == 'H0':
+        print('H0 accepted: {} is not stronger by more than {:g} Elo'.format(args.player, args.elo0))
+    else:
+        print('Undecided after {} games'.format(args.max_games))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,49 +1,74 @@
-import time
+import os
+import uuid
 
 import abstract
 from Reversi.consts import BOARD_COLS, BOARD_ROWS, OPPONENT_COLOR, EM
-from utils import INFINITY, MiniMaxWithAlphaBetaPruning
+from utils import INFINITY, MiniMaxWithAlphaBetaPruning, SearchTracer
 
 
 class Player(abstract.AbstractPlayer):
+    # When set, the searches of every move are traced, and written as Chrome trace events when the game is over to
+    # this path, suffixed with the process id, a game id and the player's color. Also set by the REVERSI_TRACE
+    # environment variable.
+    trace_path = os.environ.get('REVERSI_TRACE')
+
     def __init__(self, setup_time, player_color, time_per_k_turns, k):
         abstract.AbstractPlayer.__init__(self, setup_time, player_color, time_per_k_turns, k)
-        self.clock = time.time()
+        self.clock = self.time_source.time()
         # We are simply providing (remaining time / remaining turns) for each turn in round.
         # Taking a spare time of 0.05 seconds.
         self.turns_remaining_in_round = self.k
         self.time_remaining_in_round = self.time_per_k_turns
         self.time_for_current_move = self.time_remaining_in_round / self.turns_remaining_in_round - 0.05
+        self.tracer = SearchTracer() if self.trace_path else None
+        self.game_id = uuid.uuid4().hex[:8]
 
     def get_move(self, game_state, possible_moves):
-        self.clock = time.time()
+        self.clock = self.time_source.time()
         self.time_for_current_move = self.time_remaining_in_round / self.turns_remaining_in_round - 0.05
+        self.search_info = None
+        self.search_score = None
 
         if len(possible_moves) == 1:
             return possible_moves[0]
 
-        best_move = self.iterative_deepening(game_state)
+        if self.tracer is not None:
+            start = self.tracer.now()
+            best_move = self.iterative_deepening(game_state)
+            self.tracer.span('get_move', start, {'move': best_move, 'budget': self.time_for_current_move})
+        else:
+            best_move = self.iterative_deepening(game_state)
 
         if self.turns_remaining_in_round == 1:
             self.turns_remaining_in_round = self.k
             self.time_remaining_in_round = self.time_per_k_turns
         else:
             self.turns_remaining_in_round -= 1
-            self.time_remaining_in_round -= (time.time() - self.clock)
+            self.time_remaining_in_round -= (self.time_source.time() - self.clock)
 
         return best_move
 
+    def stop(self):
+        # The trace is written once, outside the timed moves
+        if self.tracer is not None and self.tracer.events:
+            self.tracer.write('{}.{}.{}.{}.json'.format(self.trace_path, os.getpid(), self.game_id, self.color))
+
     def iterative_deepening(self, state):
-        alpha_beta = MiniMaxWithAlphaBetaPruning(self.utility, self.color, self.no_more_time, False)
+        alpha_beta = MiniMaxWithAlphaBetaPruning(self.utility, self.color, self.no_more_time, False,
+                                                 tracer=self.tracer, clock=self.time_source)
         depth = 1
         optimal_move = None
+        optimal_value = None
         while True:
-            _, move = alpha_beta.search(state, depth, -INFINITY, INFINITY, True)
+            value, move = alpha_beta.search(state, depth, -INFINITY, INFINITY, True)
             if move is None:
                 break
             optimal_move = move
+            optimal_value = value
             depth += 1
 
+        self.search_info = (alpha_beta.nodes, depth - 1)
+        self.search_score = optimal_value
         return optimal_move
 
     def utility(self, state):
@@ -152,7 +177,7 @@ class Player(abstract.AbstractPlayer):
         return my_corner_tiles - op_corner_tiles
 
     def no_more_time(self):
-        return (time.time() - self.clock) >= self.time_for_current_move
+        return (self.time_source.time() - self.clock) >= self.time_for_current_move
 
     def get_tiles_count(self, state):
         tile = 0
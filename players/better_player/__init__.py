@@ -1,9 +1,8 @@
 import copy
-import operator
-import time
 
 import abstract
-from Reversi.board import GameState, OPPONENT_COLOR
+from Reversi import book
+from Reversi.board import OPPONENT_COLOR
 from Reversi.consts import BOARD_COLS, BOARD_ROWS, EM
 from utils import INFINITY
 
@@ -11,7 +10,7 @@ from utils import INFINITY
 class Player(abstract.AbstractPlayer):
     def __init__(self, setup_time, player_color, time_per_k_turns, k):
         abstract.AbstractPlayer.__init__(self, setup_time, player_color, time_per_k_turns, k)
-        self.clock = time.time()
+        self.clock = self.time_source.time()
 
         # We are simply providing (remaining time / remaining turns) for each turn in round.
         # Taking a spare time of 0.05 seconds.
@@ -27,17 +26,14 @@ class Player(abstract.AbstractPlayer):
         :param possible_moves:
         :return: Tuple of (x,y)
         """
-        self.clock = time.time()
+        self.clock = self.time_source.time()
         self.time_for_current_move = self.time_remaining_in_round / self.turns_remaining_in_round - 0.05
 
-        self.hist_mgr.update(new_board=game_state.board)
         if len(possible_moves) == 1:
-            self.hist_mgr.update(new_move=possible_moves[0])
             return possible_moves[0]
 
-        hist_mgr_out = self.opening_move()
+        hist_mgr_out = self.opening_move(game_state)
         if hist_mgr_out is not None:
-            self.hist_mgr.update(new_move=hist_mgr_out)
             return hist_mgr_out
 
         best_move = possible_moves[0]
@@ -46,6 +42,8 @@ class Player(abstract.AbstractPlayer):
         # Choosing an arbitrary move
         # Get the best move according the utility function
         for move in possible_moves:
+            # An evaluated child costs a node of virtual time
+            self.time_source.charge()
             new_state = copy.deepcopy(game_state)
             new_state.perform_move(move[0], move[1])
             if self.utility(new_state) > self.utility(next_state):
@@ -57,13 +55,12 @@ class Player(abstract.AbstractPlayer):
             self.time_remaining_in_round = self.time_per_k_turns
         else:
             self.turns_remaining_in_round -= 1
-            self.time_remaining_in_round -= (time.time() - self.clock)
+            self.time_remaining_in_round -= (self.time_source.time() - self.clock)
 
-        self.hist_mgr.update(new_move=best_move)
         return best_move
 
-    def opening_move(self):
-        return self.hist_mgr.get_next_move()
+    def opening_move(self, game_state):
+        return self.hist_mgr.get_next_move(game_state)
 
     def utility(self, state):
         delta_tiles = self.get_delta_tiles(state)
@@ -171,7 +168,7 @@ class Player(abstract.AbstractPlayer):
         return my_corner_tiles - op_corner_tiles
 
     def no_more_time(self):
-        return (time.time() - self.clock) >= self.time_for_current_move
+        return (self.time_source.time() - self.clock) >= self.time_for_current_move
 
     def get_tiles_count(self, state):
         tile = 0
@@ -186,76 +183,19 @@ class Player(abstract.AbstractPlayer):
 
 
 class HistoryManager:
-    def __init__(self):
-        self.board = self.flatten_board(GameState().board)
-        self.opening_list = []
-        with open(r"Reversi/book.gam", "r") as opening_file:
-            games = opening_file.readlines()
-            opening_hist = dict()
-            for game in games:
-                opening = game[:30]
-                if opening not in opening_hist:
-                    opening_hist[opening] = 1
-                else:
-                    opening_hist[opening] += 1
-            sorted_hist = sorted(opening_hist.items(), key=operator.itemgetter(1), reverse=True)
-            for entry in sorted_hist[:70]:
-                self.opening_list.append(str(entry[0]) + " " + str(entry[1]))
-
-
-        self.history_string = ""
-        self.first_char = "+"
-
-    def update(self, new_board=None, new_move=None):
-        """
+    def __init__(self, book_path=r"Reversi/book.gam", compiled_book_path=r"Reversi/book.bin"):
+        """Opens the opening book. The compiled book is only memory-mapped. Without it, the text book is parsed (see
+        Reversi.book.open_book). Without either, the book is empty.
+        The book is keyed on canonical positions, so rotated and reflected book lines are matched too.
 
-        :param list new_board:
-        :param tuple new_move:
-        :return: None
+        :param book_path: The text book. See Reversi.book.
+        :param compiled_book_path: The book compiled by Reversi.book.
         """
-        if new_board is None and new_move is None:
-            raise Exception("Not enough parameters")
-        elif new_board is not None and new_move is not None:
-            raise Exception("Too many parameters")
-
-        if new_board is not None:
-            for x in range(BOARD_COLS):
-                for y in range(BOARD_ROWS):
-                    if self.board[x][y] == EM and new_board[x][y] != EM:
-                        self.history_string += (self.first_char + self.col2letter(y) + str(x + 1))
-                        self.board[x][y] = "+"
-                        self.first_char = "+" if self.first_char == "-" else "-"
-                        break  # no need to continue, the method should be called after each move...
-        elif new_move is not None:
-            if self.board[new_move[0]][new_move[1]] != EM:
-                return
-            self.history_string += (self.first_char + self.col2letter(new_move[1]) + str(new_move[0] + 1))
-            self.board[new_move[0]][new_move[1]] = "+"
-            self.first_char = "+" if self.first_char == "-" else "-"
-
-    def get_next_move(self):
-        next_mv = ""
-        history_str_len = self.history_string.__len__()
-        for game in self.opening_list:
-            if game.startswith(self.history_string):
-                next_mv = game[history_str_len + 1:history_str_len + 3]
-                break
-        if next_mv == "":
-            return None
-        return int(next_mv[1]) - 1, self.letter2col(next_mv[0])
-
-    @staticmethod
-    def flatten_board(board: list):
-        for x in range(BOARD_COLS):
-            for y in range(BOARD_ROWS):
-                if board[x][y] != EM:
-                    board[x][y] = "+"
-        return board
+        self.book = book.open_book(book_path, compiled_book_path)
 
-    @staticmethod
-    def col2letter(c):
-        return chr(ord('a') + c)
+    def get_next_move(self, game_state):
+        """Returns the book continuation with the best score for the player to move, or None out of book.
 
-    @staticmethod
-    def letter2col(l):
-        return ord(l) - ord('a')
+        :param GameState game_state: The current state.
+        """
+        return self.book.best_move(game_state)
@@ -1,49 +1,116 @@
-import time
+import json
+import os
 
 import abstract
 from Reversi.consts import BOARD_COLS, BOARD_ROWS, OPPONENT_COLOR, EM
+from solved_db import SolvedPositionStore
 from utils import INFINITY, MiniMaxWithAlphaBetaPruning
 
+# Written by train_mlp.py. When it exists the player evaluates positions with the neural network instead of the
+# hand-written utility.
+MLP_PATH = os.path.join(os.path.dirname(__file__), 'mlp.npz')
+
+# Built by solved_db.py. Positions found in it are played without searching.
+SOLVED_DB_PATH = os.path.join(os.path.dirname(__file__), 'solved.db')
+
+# Written by tuning.py. The hand-picked weights below are used when the file is missing.
+WEIGHTS_PATH = os.path.join(os.path.dirname(__file__), 'weights.json')
+DEFAULT_WEIGHTS = {
+    'delta_tiles': 1.0,
+    'mobility': 1.0,
+    'potential_mobility': 1.0,
+    'corner_ratio': 4.0,
+}
+
+
+def load_weights(path=WEIGHTS_PATH):
+    """Loads the utility weights.
+
+    :param path: A json file mapping each utility term to its weight.
+    :return: A dict with a weight for every term of DEFAULT_WEIGHTS.
+    """
+    weights = dict(DEFAULT_WEIGHTS)
+    if os.path.isfile(path):
+        with open(path, 'r') as weights_file:
+            weights.update(json.load(weights_file))
+    return weights
+
 
 class Player(abstract.AbstractPlayer):
     def __init__(self, setup_time, player_color, time_per_k_turns, k):
         abstract.AbstractPlayer.__init__(self, setup_time, player_color, time_per_k_turns, k)
-        self.clock = time.time()
+        self.clock = self.time_source.time()
         # We are simply providing (remaining time / remaining turns) for each turn in round.
         # Taking a spare time of 0.05 seconds.
         self.turns_remaining_in_round = self.k
         self.time_remaining_in_round = self.time_per_k_turns
         self.time_for_current_move = self.time_remaining_in_round / self.turns_remaining_in_round - 0.05
+        self.weights = load_weights()
+        self.evaluator = None
+        if os.path.isfile(MLP_PATH):
+            from .mlp import MLPEvaluator
+            self.evaluator = MLPEvaluator.load(MLP_PATH)
+        self.solved_positions = SolvedPositionStore.open(SOLVED_DB_PATH)
+        # The depth of the last search, the least depth of a stored search value that is played instead of searching
+        self.search_depth = None
 
     def get_move(self, game_state, possible_moves):
-        self.clock = time.time()
+        self.clock = self.time_source.time()
         self.time_for_current_move = self.time_remaining_in_round / self.turns_remaining_in_round - 0.05
+        self.search_info = None
+        self.search_score = None
 
         if len(possible_moves) == 1:
             return possible_moves[0]
 
-        best_move = self.iterative_deepening(game_state)
+        best_move = self.solved_move(game_state, possible_moves)
+        if best_move is None:
+            best_move = self.iterative_deepening(game_state)
 
         if self.turns_remaining_in_round == 1:
             self.turns_remaining_in_round = self.k
             self.time_remaining_in_round = self.time_per_k_turns
         else:
             self.turns_remaining_in_round -= 1
-            self.time_remaining_in_round -= (time.time() - self.clock)
+            self.time_remaining_in_round -= (self.time_source.time() - self.clock)
 
         return best_move
 
+    def solved_move(self, state, possible_moves):
+        """Returns the stored best move of the position, or None if it is not in the solved positions store. A stored
+        search value is only trusted if its search was at least as deep as the player's own last search.
+        """
+        if self.solved_positions is None:
+            return None
+        solved = self.solved_positions.lookup(state)
+        if solved is None or solved[1] not in possible_moves:
+            return None
+        _, move, depth, exact = solved
+        if not exact and (self.search_depth is None or depth < self.search_depth):
+            return None
+        return move
+
     def iterative_deepening(self, state):
-        alpha_beta = MiniMaxWithAlphaBetaPruning(self.utility, self.color, self.no_more_time, False)
+        if self.evaluator is not None:
+            alpha_beta = MiniMaxWithAlphaBetaPruning(self.neural_utility, self.color, self.no_more_time, False,
+                                                     self.batch_neural_utility, clock=self.time_source)
+        else:
+            alpha_beta = MiniMaxWithAlphaBetaPruning(self.utility, self.color, self.no_more_time, False,
+                                                     clock=self.time_source)
         depth = 1
         optimal_move = None
+        optimal_value = None
         while True:
-            _, move = alpha_beta.search(state, depth, -INFINITY, INFINITY, True)
+            value, move = alpha_beta.search(state, depth, -INFINITY, INFINITY, True)
             if move is None:
                 break
             optimal_move = move
+            optimal_value = value
             depth += 1
 
+        self.search_info = (alpha_beta.nodes, depth - 1)
+        self.search_score = optimal_value
+        self.search_depth = depth - 1
         return optimal_move
 
     def utility(self, state):
@@ -56,8 +123,16 @@ class Player(abstract.AbstractPlayer):
 
         number_of_tiles = self.get_tiles_count(state)
 
-        return number_of_tiles * delta_tiles / 32 + (64 - number_of_tiles) * (
-                mobility + potential_mobility + 4 * corner_ratio) / 32
+        w = self.weights
+        return number_of_tiles * w['delta_tiles'] * delta_tiles / 32 + (64 - number_of_tiles) * (
+                w['mobility'] * mobility + w['potential_mobility'] * potential_mobility +
+                w['corner_ratio'] * corner_ratio) / 32
+
+    def neural_utility(self, state):
+        return self.evaluator.evaluate([state], self.color)[0]
+
+    def batch_neural_utility(self, states):
+        return self.evaluator.evaluate(states, self.color)
 
     def get_delta_tiles(self, state):
         my_u = 0
@@ -152,7 +227,7 @@ class Player(abstract.AbstractPlayer):
         return my_corner_tiles - op_corner_tiles
 
     def no_more_time(self):
-        return (time.time() - self.clock) >= self.time_for_current_move
+        return (self.time_source.time() - self.clock) >= self.time_for_current_move
 
     def get_tiles_count(self, state):
         tile = 0
@@ -0,0 +1,97 @@
+"""A small NumPy multi-layer perceptron evaluator, used by the competition player instead of the hand-written utility
+when its weights file exists. Train it with train_mlp.py.
+"""
+import numpy as np
+
+from Reversi.bitboard_np import move_mask, popcount
+from Reversi.consts import OPPONENT_COLOR
+from utils import INFINITY
+
+# The network predicts the final disc difference divided by this.
+OUTPUT_SCALE = 64.0
+
+# Little endian bit order, so bit x * 8 + y of the packed bitboard is square (x, y).
+_BIT_WEIGHTS = (np.uint64(1) << np.arange(64, dtype=np.uint64))
+
+
+def bits_to_planes(own, opp, to_move):
+    """Builds the network input from bitboards.
+
+    :param own: uint64 array of the evaluated player's discs.
+    :param opp: uint64 array of the opponent's discs.
+    :param to_move: bool array, True where the evaluated player is the one to move.
+    :return: float32 array of shape (N, 129): the own plane, the opponent plane and the side to move.
+    """
+    own = np.asarray(own, dtype=np.uint64)
+    opp = np.asarray(opp, dtype=np.uint64)
+    inputs = np.empty((own.shape[0], 129), dtype=np.float32)
+    inputs[:, :64] = (own[:, None] & _BIT_WEIGHTS) != 0
+    inputs[:, 64:128] = (opp[:, None] & _BIT_WEIGHTS) != 0
+    inputs[:, 128] = to_move
+    return inputs
+
+
+def states_to_bits(states, color):
+    """Converts GameState objects to bitboards from the point of view of 'color', with a single NumPy conversion for
+    the whole batch.
+
+    :return: A tuple: (own bits, opponent bits, bool array of color to move)
+    """
+    boards = np.array([state.board for state in states]).reshape(len(states), 64)
+    weights = _BIT_WEIGHTS
+    own = np.where(boards == color, weights, np.uint64(0)).sum(axis=1, dtype=np.uint64)
+    opp = np.where(boards == OPPONENT_COLOR[color], weights, np.uint64(0)).sum(axis=1, dtype=np.uint64)
+    to_move = np.array([state.curr_player == color for state in states])
+    return own, opp, to_move
+
+
+class MLPEvaluator:
+    def __init__(self, w1, b1, w2, b2):
+        """Initialize an evaluator from its layers: one hidden ReLU layer and a tanh output.
+
+        :param w1: Hidden layer weights, shape (129, hidden).
+        :param b1: Hidden layer biases, shape (hidden,).
+        :param w2: Output weights, shape (hidden, 1).
+        :param b2: Output bias, shape (1,).
+        """
+        self.w1 = np.asarray(w1, dtype=np.float32)
+        self.b1 = np.asarray(b1, dtype=np.float32)
+        self.w2 = np.asarray(w2, dtype=np.float32)
+        self.b2 = np.asarray(b2, dtype=np.float32)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as weights:
+            return cls(weights['w1'], weights['b1'], weights['w2'], weights['b2'])
+
+    def save(self, path):
+        np.savez(path, w1=self.w1, b1=self.b1, w2=self.w2, b2=self.b2)
+
+    def forward(self, inputs):
+        hidden = np.maximum(inputs @ self.w1 + self.b1, 0)
+        return np.tanh(hidden @ self.w2 + self.b2)[:, 0]
+
+    def evaluate_bits(self, own, opp, to_move):
+        """Evaluates a batch of positions with one matrix multiply per layer.
+
+        Positions where the player to move has no moves are over, and get the exact +-INFINITY (or 0 for a tie) the
+        hand-written utility uses.
+
+        :return: float64 array of values in disc difference units, from the point of view of the 'own' player.
+        """
+        values = self.forward(bits_to_planes(own, opp, to_move)).astype(np.float64) * OUTPUT_SCALE
+
+        mover = np.where(to_move, own, opp)
+        waiting = np.where(to_move, opp, own)
+        over = move_mask(mover, waiting) == 0
+        if over.any():
+            diff = popcount(own[over]) - popcount(opp[over])
+            values[over] = np.sign(diff) * INFINITY
+        return values
+
+    def evaluate(self, states, color):
+        """Evaluates GameState objects from the point of view of 'color'.
+
+        :return: A list of floats, one per state.
+        """
+        return self.evaluate_bits(*states_to_bits(states, color)).tolist()
@@ -0,0 +1,11 @@
+"""A player whose moves are searched by an external engine, through the engine protocol (see engine_protocol.py).
+
+The engine is set by the REVERSI_ENGINE environment variable: a command line starting the engine, or tcp://host:port
+for an engine server. For example:
+    REVERSI_ENGINE="python3 engine_protocol.py engine competition_player" python3 run_game.py 2 10 5 n external_player alpha_beta_player
+"""
+from engine_protocol import ExternalPlayer
+
+
+class Player(ExternalPlayer):
+    pass
@@ -0,0 +1,235 @@
+"""A Monte Carlo tree search player (UCT).
+
+Positions are bitboards (see Reversi.bitboard) from the point of view of the player to move, and the playouts work on
+plain integers, so they allocate nothing per move. The playouts are random, except that a corner is always taken when
+one is available. The tree is kept between moves: the node of the position after the opponent's reply becomes the
+next root. The player searches until its time for the move runs out.
+"""
+import math
+import random
+
+import abstract
+from Reversi.bitboard import FULL, CORNERS, SHIFTS, from_state, popcount, bit_to_move, square
+from Reversi.consts import X_PLAYER
+
+# The UCT exploration constant
+EXPLORATION = 1.4
+# The number of playouts between two time checks
+TIME_CHECK_INTERVAL = 16
+
+_LEFT_SHIFTS = tuple((amount, mask) for amount, mask in SHIFTS if amount > 0)
+_RIGHT_SHIFTS = tuple((-amount, mask) for amount, mask in SHIFTS if amount < 0)
+
+
+def legal_moves(own, opp):
+    """Reversi.bitboard.move_mask, with the shifts unrolled by direction sign.
+    """
+    empty = ~(own | opp) & FULL
+    moves = 0
+    for amount, mask in _LEFT_SHIFTS:
+        line = (own << amount) & mask & opp
+        line |= (line << amount) & mask & opp
+        line |= (line << amount) & mask & opp
+        line |= (line << amount) & mask & opp
+        line |= (line << amount) & mask & opp
+        line |= (line << amount) & mask & opp
+        moves |= (line << amount) & mask & empty
+    for amount, mask in _RIGHT_SHIFTS:
+        line = (own >> amount) & mask & opp
+        line |= (line >> amount) & mask & opp
+        line |= (line >> amount) & mask & opp
+        line |= (line >> amount) & mask & opp
+        line |= (line >> amount) & mask & opp
+        line |= (line >> amount) & mask & opp
+        moves |= (line >> amount) & mask & empty
+    return moves
+
+
+def move_flips(own, opp, move):
+    """Reversi.bitboard.flips, with the shifts inlined.
+    """
+    flipped = 0
+    for amount, mask in _LEFT_SHIFTS:
+        line = 0
+        current = (move << amount) & mask
+        while current & opp:
+            line |= current
+            current = (current << amount) & mask
+        if current & own:
+            flipped |= line
+    for amount, mask in _RIGHT_SHIFTS:
+        line = 0
+        current = (move >> amount) & mask
+        while current & opp:
+            line |= current
+            current = (current >> amount) & mask
+        if current & own:
+            flipped |= line
+    return flipped
+
+
+def random_move(moves, rng):
+    """Picks a move bit of a moves mask, a corner if there is one.
+    """
+    if moves & CORNERS:
+        moves &= CORNERS
+    for _ in range(rng.randrange(popcount(moves))):
+        moves &= moves - 1
+    return moves & -moves
+
+
+def playout(own, opp, rng):
+    """Plays random moves until the player to move has none.
+
+    :return: The final disc difference for the player to move at the start, owning 'own'.
+    """
+    sign = 1
+    while True:
+        moves = legal_moves(own, opp)
+        if not moves:
+            return sign * (popcount(own) - popcount(opp))
+        move = random_move(moves, rng)
+        flipped = move_flips(own, opp, move)
+        own, opp = opp ^ flipped, own | move | flipped
+        sign = -sign
+
+
+class Node:
+    __slots__ = ('own', 'opp', 'parent', 'children', 'untried', 'visits', 'reward')
+
+    def __init__(self, own, opp, parent=None):
+        """A position of the tree, with 'own' the discs of the player to move.
+        """
+        self.own = own
+        self.opp = opp
+        self.parent = parent
+        # move bit -> Node
+        self.children = {}
+        self.untried = legal_moves(own, opp)
+        self.visits = 0
+        # The total reward of the player who moved into this node: 1 per win and 0.5 per draw
+        self.reward = 0.0
+
+    def select_child(self):
+        log_visits = math.log(self.visits)
+        return max(self.children.values(), key=lambda child: child.reward / child.visits +
+                   EXPLORATION * math.sqrt(log_visits / child.visits))
+
+    def expand(self, rng):
+        move = random_move(self.untried, rng)
+        self.untried &= ~move
+        flipped = move_flips(self.own, self.opp, move)
+        child = Node(self.opp ^ flipped, self.own | move | flipped, self)
+        self.children[move] = child
+        return child
+
+
+class Player(abstract.AbstractPlayer):
+    def __init__(self, setup_time, player_color, time_per_k_turns, k):
+        abstract.AbstractPlayer.__init__(self, setup_time, player_color, time_per_k_turns, k)
+        self.clock = self.time_source.time()
+        # We are simply providing (remaining time / remaining turns) for each turn in round.
+        # Taking a spare time of 0.05 seconds.
+        self.turns_remaining_in_round = self.k
+        self.time_remaining_in_round = self.time_per_k_turns
+        self.time_for_current_move = self.time_remaining_in_round / self.turns_remaining_in_round - 0.05
+        self.rng = random.Random()
+        self.root = None
+        # The playouts per second of every searched move
+        self.playout_rates = []
+
+    def get_move(self, game_state, possible_moves):
+        self.clock = self.time_source.time()
+        self.time_for_current_move = self.time_remaining_in_round / self.turns_remaining_in_round - 0.05
+        self.search_info = None
+        self.search_score = None
+
+        self.root = self.find_root(game_state)
+        if len(possible_moves) == 1:
+            best_move = possible_moves[0]
+        else:
+            best_move = self.search()
+
+        if self.turns_remaining_in_round == 1:
+            self.turns_remaining_in_round = self.k
+            self.time_remaining_in_round = self.time_per_k_turns
+        else:
+            self.turns_remaining_in_round -= 1
+            self.time_remaining_in_round -= (self.time_source.time() - self.clock)
+
+        self.play(best_move)
+        return best_move
+
+    def find_root(self, state):
+        """Returns the node of the state in the kept tree, or a new tree.
+        """
+        x_bits, o_bits = from_state(state)
+        own, opp = (x_bits, o_bits) if state.curr_player == X_PLAYER else (o_bits, x_bits)
+        if self.root is not None:
+            for child in self.root.children.values():
+                if child.own == own and child.opp == opp:
+                    child.parent = None
+                    return child
+        return Node(own, opp)
+
+    def play(self, move):
+        """Moves the root to the child of our move, keeping its subtree for the next move.
+        """
+        bit = square(move[0], move[1])
+        child = self.root.children.get(bit)
+        if child is None:
+            flipped = move_flips(self.root.own, self.root.opp, bit)
+            child = Node(self.root.opp ^ flipped, self.root.own | bit | flipped)
+        child.parent = None
+        self.root = child
+
+    def search(self):
+        """Runs playouts from the root until the time is up.
+
+        :return: The most visited move.
+        """
+        root = self.root
+        rng = self.rng
+        playouts = 0
+        # The deepest node a playout started from, in moves below the root
+        max_depth = 0
+        start = self.time_source.time()
+        while True:
+            for _ in range(TIME_CHECK_INTERVAL):
+                node = root
+                depth = 0
+                while not node.untried and node.children:
+                    node = node.select_child()
+                    depth += 1
+                if node.untried:
+                    node = node.expand(rng)
+                    depth += 1
+                if depth > max_depth:
+                    max_depth = depth
+                # The result for the player to move at the node, so the reward of the player who moved into it is
+                # for the opposite result
+                result = playout(node.own, node.opp, rng)
+                reward = 0.0 if result > 0 else 1.0 if result < 0 else 0.5
+                while node is not None:
+                    node.visits += 1
+                    node.reward += reward
+                    reward = 1.0 - reward
+                    node = node.parent
+                playouts += 1
+            # A playout costs a node of virtual time
+            self.time_source.charge(TIME_CHECK_INTERVAL)
+            if self.no_more_time():
+                break
+
+        elapsed = self.time_source.time() - start
+        self.playout_rates.append(playouts / elapsed if elapsed > 0 else 0.0)
+        self.search_info = (playouts, max_depth)
+        best = max(root.children, key=lambda move: root.children[move].visits)
+        self.search_score = root.children[best].reward / root.children[best].visits
+        return bit_to_move(best)
+
+    def no_more_time(self):
+        return (self.time_source.time() - self.clock) >= self.time_for_current_move
+
+    def __repr__(self):
+        return '{} {}'.format(abstract.AbstractPlayer.__repr__(self), 'mcts')
@@ -1,5 +1,3 @@
-import time
-
 import abstract
 from Reversi.consts import BOARD_ROWS, BOARD_COLS, OPPONENT_COLOR, EM
 from utils import MiniMaxAlgorithm, INFINITY
@@ -8,7 +6,7 @@ from utils import MiniMaxAlgorithm, INFINITY
 class Player(abstract.AbstractPlayer):
     def __init__(self, setup_time, player_color, time_per_k_turns, k):
         abstract.AbstractPlayer.__init__(self, setup_time, player_color, time_per_k_turns, k)
-        self.clock = time.time()
+        self.clock = self.time_source.time()
         # We are simply providing (remaining time / remaining turns) for each turn in round.
         # Taking a spare time of 0.05 seconds.
         self.turns_remaining_in_round = self.k
@@ -16,8 +14,10 @@ class Player(abstract.AbstractPlayer):
         self.time_for_current_move = self.time_remaining_in_round / self.turns_remaining_in_round - 0.05
 
     def get_move(self, game_state, possible_moves):
-        self.clock = time.time()
+        self.clock = self.time_source.time()
         self.time_for_current_move = self.time_remaining_in_round / self.turns_remaining_in_round - 0.05
+        self.search_info = None
+        self.search_score = None
 
         if len(possible_moves) == 1:
             return possible_moves[0]
@@ -29,21 +29,25 @@ class Player(abstract.AbstractPlayer):
             self.time_remaining_in_round = self.time_per_k_turns
         else:
             self.turns_remaining_in_round -= 1
-            self.time_remaining_in_round -= (time.time() - self.clock)
+            self.time_remaining_in_round -= (self.time_source.time() - self.clock)
 
         return best_move
 
     def iterative_deepening(self, state):
-        mini_max = MiniMaxAlgorithm(self.utility, self.color, self.no_more_time, False)
+        mini_max = MiniMaxAlgorithm(self.utility, self.color, self.no_more_time, False, clock=self.time_source)
         depth = 1
         optimal_move = None
+        optimal_value = None
         while True:
-            _, move = mini_max.search(state, depth, True)
+            value, move = mini_max.search(state, depth, True)
             if move is None:
                 break
             optimal_move = move
+            optimal_value = value
             depth += 1
 
+        self.search_info = (mini_max.nodes, depth - 1)
+        self.search_score = optimal_value
         return optimal_move
 
     def utility(self, state):
@@ -152,7 +156,7 @@ class Player(abstract.AbstractPlayer):
         return my_corner_tiles - op_corner_tiles
 
     def no_more_time(self):
-        return (time.time() - self.clock) >= self.time_for_current_move
+        return (self.time_source.time() - self.clock) >= self.time_for_current_move
 
     def get_tiles_count(self, state):
         tile = 0
@@ -4,7 +4,6 @@
 #===============================================================================
 
 import copy
-import time
 
 import abstract
 from Reversi.consts import OPPONENT_COLOR, BOARD_COLS, BOARD_ROWS
@@ -18,7 +17,7 @@ from utils import INFINITY
 class Player(abstract.AbstractPlayer):
     def __init__(self, setup_time, player_color, time_per_k_turns, k):
         abstract.AbstractPlayer.__init__(self, setup_time, player_color, time_per_k_turns, k)
-        self.clock = time.time()
+        self.clock = self.time_source.time()
 
         # We are simply providing (remaining time / remaining turns) for each turn in round.
         # Taking a spare time of 0.05 seconds.
@@ -27,7 +26,7 @@ class Player(abstract.AbstractPlayer):
         self.time_for_current_move = self.time_remaining_in_round / self.turns_remaining_in_round - 0.05
 
     def get_move(self, game_state, possible_moves):
-        self.clock = time.time()
+        self.clock = self.time_source.time()
         self.time_for_current_move = self.time_remaining_in_round / self.turns_remaining_in_round - 0.05
         if len(possible_moves) == 1:
             return possible_moves[0]
@@ -38,6 +37,8 @@ class Player(abstract.AbstractPlayer):
         # Choosing an arbitrary move
         # Get the best move according the utility function
         for move in possible_moves:
+            # An evaluated child costs a node of virtual time
+            self.time_source.charge()
             new_state = copy.deepcopy(game_state)
             new_state.perform_move(move[0],move[1])
             if self.utility(new_state) > self.utility(next_state):
@@ -49,7 +50,7 @@ class Player(abstract.AbstractPlayer):
             self.time_remaining_in_round = self.time_per_k_turns
         else:
             self.turns_remaining_in_round -= 1
-            self.time_remaining_in_round -= (time.time() - self.clock)
+            self.time_remaining_in_round -= (self.time_source.time() - self.clock)
 
         return best_move
 
@@ -80,7 +81,7 @@ class Player(abstract.AbstractPlayer):
         return False
 
     def no_more_time(self):
-        return (time.time() - self.clock) >= self.time_for_current_move
+        return (self.time_source.time() - self.clock) >= self.time_for_current_move
 
     def __repr__(self):
         return '{} {}'.format(abstract.AbstractPlayer.__repr__(self), 'simple')
@@ -0,0 +1,153 @@
+"""Re-analyzes recorded games to find the moves that lost them.
+
+Every position of the game records (see Reversi.game_record) is searched again, with more time than the players had:
+    - positions with at most --exact-empties empty squares are solved exactly (see Reversi.bitboard.solve), and the
+      moves are scored by the final disc difference.
+    - the others are searched with alpha-beta to a fixed --depth after every legal move, with the utility of an
+      evaluator player (the competition player by default).
+A move is flagged when its score falls more than the margin below the best move's score. The positions are spread
+over a process pool, one task per position.
+
+For example:
+    python3 reanalyze.py games.rec --depth 4 --exact-empties 10
+    python3 reanalyze.py games.rec --player better_player --only competition_player --out blunders.csv
+"""
+import argparse
+import copy
+import multiprocessing
+import sys
+
+from Reversi.bitboard import from_state, flips, popcount, solve, square
+from Reversi.consts import X_PLAYER, O_PLAYER, OPPONENT_COLOR
+from Reversi.game_record import read_games
+from Reversi.board import GameState
+from utils import INFINITY, MiniMaxWithAlphaBetaPruning
+
+# The evaluator player of each color, built once per worker
+_evaluators = {}
+_evaluator_name = None
+
+
+def init_worker(evaluator_name):
+    global _evaluator_name
+    _evaluator_name = evaluator_name
+
+
+def evaluator(color):
+    if color not in _evaluators:
+        __import__('players.{}'.format(_evaluator_name))
+        _evaluators[color] = sys.modules['players.{}'.format(_evaluator_name)].Player(1, color, 1, 1)
+    return _evaluators[color]
+
+
+def search_scores(state, depth):
+    """Scores every legal move by an alpha-beta search of the position after it.
+
+    :return: A dict: move -> score for the player to move.
+    """
+    player = evaluator(state.curr_player)
+    alpha_beta = MiniMaxWithAlphaBetaPruning(player.utility, player.color, lambda: False, False)
+    scores = {}
+    for move in state.get_possible_moves():
+        next_state = copy.deepcopy(state)
+        next_state.perform_move(move[0], move[1])
+        scores[tuple(move)], _ = alpha_beta.search(next_state, depth - 1, -INFINITY, INFINITY, False)
+    return scores
+
+
+def exact_scores(state):
+    """Scores every legal move by the final disc difference with perfect play after it.
+
+    :return: A dict: move -> score for the player to move.
+    """
+    x_bits, o_bits = from_state(state)
+    own, opp = (x_bits, o_bits) if state.curr_player == X_PLAYER else (o_bits, x_bits)
+    scores = {}
+    for move in state.get_possible_moves():
+        bit = square(move[0], move[1])
+        flipped = flips(own, opp, bit)
+        scores[tuple(move)] = -solve(opp ^ flipped, own | bit | flipped)[0]
+    return scores
+
+
+def analyze_position(task):
+    """Runs in the pool.
+
+    :param task: (game index, ply, the player to move, its opponent, the moves before the position, the move played,
+                 depth, exact empties)
+    :return: A tuple: (game index, ply, player, opponent, played move, its score, best move, its score, whether the
+             scores are exact), or None for a position with a single legal move.
+    """
+    game, ply, player, opponent, moves, played, depth, exact_empties = task
+    state = GameState()
+    for x, y in moves:
+        state.perform_move(x, y)
+    if len(state.get_possible_moves()) < 2:
+        return None
+    x_bits, o_bits = from_state(state)
+    exact = 64 - popcount(x_bits | o_bits) <= exact_empties
+    scores = exact_scores(state) if exact else search_scores(state, depth)
+    best_move = max(scores, key=scores.get)
+    return game, ply, player, opponent, played, scores[played], best_move, scores[best_move], exact
+
+
+def make_tasks(records_path, depth, exact_empties, only=None):
+    """
+    :param only: Optional. Only the positions where this player module is to move.
+    :return: A generator of analyze_position tasks, reading the records lazily.
+    """
+    for game, record in enumerate(read_games(records_path, with_infos=False)):
+        for ply, move in enumerate(record.moves):
+            # There are no passes, so the players alternate
+            color = X_PLAYER if ply % 2 == 0 else O_PLAYER
+            if only is not None and record.players[color] != only:
+                continue
+            yield (game, ply, record.players[color], record.players[OPPONENT_COLOR[color]], record.moves[:ply],
+                   tuple(move), depth, exact_empties)
+
+
+def move_name(move):
+    return '{}{}'.format(chr(ord('a') + move[1]), move[0] + 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Flags the moves of recorded games that lose the most.')
+    parser.add_argument('records', help='A game records file.')
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--exact-empties', type=int, default=10,
+                        help='Positions with at most this many empty squares are solved exactly.')
+    parser.add_argument('--player', default='competition_player', help='The player whose utility is searched.')
+    parser.add_argument('--only', default=None, help='Only analyze the moves of this player.')
+    parser.add_argument('--margin', type=float, default=4.0, help='The utility loss that flags a searched move.')
+    parser.add_argument('--exact-margin', type=int, default=6, help='The disc loss that flags a solved move.')
+    parser.add_argument('--processes', type=int, default=None, help='Defaults to the number of cores.')
+    parser.add_argument('--out', default=None, help='Also write the flagged moves to this CSV file.')
+    args = parser.parse_args()
+
+    tasks = make_tasks(args.records, args.depth, args.exact_empties, args.only)
+    flagged = []
+    analyzed = 0
+    with multiprocessing.Pool(args.processes, initializer=init_worker, initargs=(args.player,)) as pool:
+        for analysis in pool.imap_unordered(analyze_position, tasks, chunksize=4):
+            if analysis is None:
+                continue
+            analyzed += 1
+            game, ply, player, opponent, played, played_score, best_move, best_score, exact = analysis
+            if best_score - played_score > (args.exact_margin if exact else args.margin):
+                flagged.append(analysis)
+
+    lines = [(game, ply + 1, player, opponent, move_name(played), move_name(best_move), played_score, best_score,
+              'exact' if exact else 'search')
+             for game, ply, player, opponent, played, played_score, best_move, best_score, exact in sorted(flagged)]
+    for line in lines:
+        print('game {}, move {}: {} against {} played {} instead of {} ({:g} < {:g}, {})'.format(*line))
+    print('{} moves flagged in {} positions analyzed'.format(len(lines), analyzed))
+    if args.out:
+        with open(args.out, 'w') as out:
+            out.write('game,move,player,opponent,played,best,played_score,best_score,kind\n')
+            for line in lines:
+                out.write(','.join(str(value) for value in line) + '\n')
+
+
+if __name__ == '__main__':
+    main()
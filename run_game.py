@@ -1,15 +1,79 @@
 """
 A generic turn-based game runner.
 """
+import cProfile
+import functools
 import sys
 from Reversi.board import GameState
 from Reversi.consts import X_PLAYER, O_PLAYER, TIE, OPPONENT_COLOR
+from Reversi.game_record import GameRecord, append_game
+import instrumentation
 import utils
 import copy
 import players.interactive
 
+class GameResult:
+    def __init__(self, x_player, o_player):
+        """The outcome of a game, as returned by GameRunner.play.
+
+        :param x_player: The name of the x player module.
+        :param o_player: The name of the o player module.
+        """
+        self.players = {X_PLAYER: x_player, O_PLAYER: o_player}
+        # X_PLAYER, O_PLAYER or TIE
+        self.winner = None
+        # The winner as returned by GameRunner.run: TIE or a tuple (player type, player)
+        self.winner_result = None
+        self.discs = {X_PLAYER: 0, O_PLAYER: 0}
+        # (x, y) for every move played
+        self.moves = []
+        # (player type, wall time, CPU time or None) for every move
+        self.move_times = []
+        # The player's search_info after every move: (nodes, depth) or None
+        self.search_infos = []
+        # The time the player had left for every move
+        self.budgets = []
+        # The player types that exceeded their time, and whether it was at setup
+        self.exceeded = ()
+        self.setup_exceeded = False
+
+    def finish(self, winner_result, board_state):
+        self.winner_result = winner_result
+        self.winner = TIE if winner_result == TIE else winner_result[0]
+        for column in board_state.board:
+            for square in column:
+                if square in self.discs:
+                    self.discs[square] += 1
+
+    def score(self, player_type):
+        """
+        :return: 1 for a win of the given player type, 0.5 for a tie and 0 for a loss.
+        """
+        if self.winner == TIE:
+            return 0.5
+        return 1 if self.winner == player_type else 0
+
+    def to_dict(self):
+        """
+        :return: The result as a dict of JSON serializable values.
+        """
+        return {
+            'x_player': self.players[X_PLAYER],
+            'o_player': self.players[O_PLAYER],
+            'winner': self.winner,
+            'discs': dict(self.discs),
+            'moves': [list(move) for move in self.moves],
+            'move_times': [list(move_time) for move_time in self.move_times],
+            'search_infos': [None if info is None else list(info) for info in self.search_infos],
+            'budgets': list(self.budgets),
+            'exceeded': list(self.exceeded),
+            'setup_exceeded': self.setup_exceeded,
+        }
+
+
 class GameRunner:
-    def __init__(self, setup_time, time_per_k_turns, k, verbose, x_player, o_player):
+    def __init__(self, setup_time, time_per_k_turns, k, verbose, x_player, o_player, backend='thread',
+                 record_path=None, profile_dir=None, clock=None):
         """Game runner initialization.
 
         :param setup_time: Setup time allowed for each player in seconds.
@@ -20,13 +84,34 @@ class GameRunner:
         :param x_player: The name of the module containing the x player. E.g. "myplayer" will invoke an
             equivalent to "import players.myplayer" in the code.
         :param o_player: Same as 'x_player' parameter, but for the other player.
+        :param backend: 'thread' runs each player call in a new thread of this process. 'process' runs each player in
+            its own long-lived process, which is killed when the player exceeds its time, and also measures the
+            player's CPU time. The interactive player always runs in this process.
+        :param record_path: Optional. A game records file (see Reversi.game_record) the game is appended to.
+        :param profile_dir: Optional. Runs the players' moves under cProfile and writes a profile per player to this
+            directory at the end of the game (see instrumentation.hot_spots). Needs the thread backend.
+        :param clock: Optional. The clock the times are measured with, given to the players after their setup.
+            Defaults to the real time. A utils.VirtualClock makes the games deterministic and faster than real time:
+            the players are then called in this thread and their times count the nodes they search. Needs the thread
+            backend.
         """
 
         self.verbose = verbose.lower()
         self.setup_time = float(setup_time)
         self.time_per_k_turns = float(time_per_k_turns)
         self.k = int(k)
+        self.backend = backend
+        self.record_path = record_path
+        self.profile_dir = profile_dir
+        if profile_dir is not None and backend != 'thread':
+            raise ValueError('Profiling needs the thread backend')
+        self.clock = clock if clock is not None else utils.WallClock()
+        if self.clock.virtual and backend != 'thread':
+            raise ValueError('A virtual clock needs the thread backend')
+        self.profilers = {}
         self.players = {}
+        # (player type, wall time, CPU time or None) for every move
+        self.move_times = []
 
         # Dynamically importing the players. This allows maximum flexibility and modularity.
         self.x_player = 'players.{}'.format(x_player)
@@ -48,27 +133,64 @@ class GameRunner:
         :param player_type: Player type, passed as an argument to the player.
         :return: A boolean. True if the player exceeded the given time. False otherwise.
         """
+        player_args = (self.setup_time, player_type, self.time_per_k_turns, self.k)
+        if self.backend == 'process' and player_class != players.interactive.Player:
+            player = utils.PlayerProcess(player_class, player_args)
+            self.players[player_type] = player
+            try:
+                measured_time, _ = player.setup(self.setup_time*1.5)
+            except (utils.ExceededTimeError, utils.PlayerCrashedError, MemoryError):
+                return True
+            return measured_time > self.setup_time
+
         try:
-            player, measured_time = utils.run_with_limited_time(
-                player_class, (self.setup_time, player_type, self.time_per_k_turns, self.k), {}, self.setup_time*1.5)
-        except MemoryError:
+            player, measured_time = utils.run_with_limited_time(player_class, player_args, {}, self.setup_time*1.5,
+                                                                self.clock)
+        except (utils.ExceededTimeError, MemoryError):
             return True
 
+        player.time_source = self.clock
         self.players[player_type] = player
         return measured_time > self.setup_time
 
     def run(self):
-        """The main loop.
+        """The main loop, printing the outcome.
         :return: The winner.
         """
+        result = self.play()
+        if result.exceeded and not result.setup_exceeded:
+            print('Player {} exceeded resources.'.format(self.players[result.exceeded[0]]))
+        self.end_game(result.winner_result)
+        if self.verbose == 'y':
+            stats = instrumentation.GameStats()
+            stats.add_result(result)
+            print(stats.report())
+        if self.profile_dir is not None:
+            for player_name, report in sorted(instrumentation.hot_spots(self.profile_dir).items()):
+                print('Hot spots of {}:\n{}'.format(player_name, report))
+        return result.winner_result
+
+    def play(self):
+        """Plays the game without printing anything, unless verbose.
+        :return: A GameResult.
+        """
+        result = GameResult(self.x_player.split('.')[-1], self.o_player.split('.')[-1])
+        self.move_times = result.move_times
+        self.search_infos = result.search_infos
+
         # Setup each player 
         x_player_exceeded = self.setup_player(sys.modules[self.x_player].Player, X_PLAYER)
         o_player_exceeded = self.setup_player(sys.modules[self.o_player].Player, O_PLAYER)
         winner = self.handle_time_expired(x_player_exceeded, o_player_exceeded)
+        board_state = GameState()
         if winner: # One of the players exceeded the setup time
-            return winner
+            self.stop_players()
+            result.exceeded = tuple(color for color, exceeded in ((X_PLAYER, x_player_exceeded),
+                                                                  (O_PLAYER, o_player_exceeded)) if exceeded)
+            result.setup_exceeded = True
+            result.finish(winner, board_state)
+            return result
 
-        board_state = GameState()
         remaining_run_times = copy.deepcopy(self.player_move_times)
         k_count = 0
 
@@ -86,18 +208,19 @@ class GameRunner:
                     winner = self.make_winner_result(board_state.get_winner())
                     break
                 # Get move from player
-                move, run_time = utils.run_with_limited_time(
-                    player.get_move, (copy.deepcopy(board_state), possible_moves), {}, remaining_run_time*1.5) ###
+                move, run_time = self.get_player_move(player, board_state, possible_moves, remaining_run_time*1.5)
+                result.budgets.append(remaining_run_time)
                 
                 remaining_run_times[board_state.curr_player] -= run_time
                 if remaining_run_times[board_state.curr_player] < 0:
                     raise utils.ExceededTimeError
-            except (utils.ExceededTimeError, MemoryError):
-                print('Player {} exceeded resources.'.format(player))
+            except (utils.ExceededTimeError, utils.PlayerCrashedError, MemoryError):
+                result.exceeded = (board_state.curr_player,)
                 winner = self.make_winner_result(OPPONENT_COLOR[board_state.curr_player])
                 break
             
             board_state.perform_move(move[0],move[1])
+            result.moves.append((move[0], move[1]))
             if self.verbose == 'y':
                 print('Player ' + repr(player) + ' performed the move: [' + str(move[0]) + ', ' + str(move[1]) + ']')
             
@@ -108,8 +231,46 @@ class GameRunner:
                     # K rounds completed. Resetting timers.
                     remaining_run_times = copy.deepcopy(self.player_move_times)
 
-        self.end_game(winner)
-        return winner
+        self.stop_players()
+        result.finish(winner, board_state)
+        self.dump_profiles(result)
+        if self.record_path is not None:
+            append_game(self.record_path,
+                        GameRecord.from_result(result, self.setup_time, self.time_per_k_turns, self.k))
+        return result
+
+    def get_player_move(self, player, board_state, possible_moves, time_limit):
+        """Asks a player for its move, with the runner's backend, and records the move times.
+
+        :return: A tuple: (The move, its wall time)
+        :raises ExceededTimeError: If the player exceeded the time limit.
+        :raises PlayerCrashedError: If the player's process died.
+        """
+        if isinstance(player, utils.PlayerProcess):
+            move, run_time, cpu_time, search_info = player.get_move(board_state, possible_moves, time_limit)
+        else:
+            cpu_time = None
+            get_move = player.get_move
+            if self.profile_dir is not None:
+                profiler = self.profilers.setdefault(board_state.curr_player, cProfile.Profile())
+                get_move = functools.partial(profiler.runcall, player.get_move)
+            move, run_time = utils.run_with_limited_time(
+                get_move, (board_state.snapshot(), possible_moves), {}, time_limit, self.clock)
+            search_info = getattr(player, 'search_info', None)
+        self.move_times.append((board_state.curr_player, run_time, cpu_time))
+        self.search_infos.append(search_info)
+        if self.verbose == 'y' and cpu_time is not None:
+            print('Move time: {:.3f}s, CPU time: {:.3f}s'.format(run_time, cpu_time))
+        return move, run_time
+
+    def dump_profiles(self, result):
+        for player_type, profiler in self.profilers.items():
+            profiler.dump_stats(instrumentation.profile_path(self.profile_dir, result.players[player_type]))
+        self.profilers = {}
+
+    def stop_players(self):
+        for player in self.players.values():
+            player.stop()
 
     @staticmethod
     def end_game(winner):
@@ -132,18 +293,42 @@ class GameRunner:
             winner = self.make_winner_result(O_PLAYER)
         elif o_player_exceeded:
             winner = self.make_winner_result(X_PLAYER)
+        return winner
 
-        if winner:
-            self.end_game(winner)
 
-        return winner
+def play_game(x_player, o_player, setup_time=2, time_per_k_turns=10, k=5, backend='thread', record_path=None,
+              profile_dir=None, clock=None):
+    """Plays a game without printing anything. The player modules are imported once per process.
+
+    :param x_player: The name of the module containing the x player, as for GameRunner.
+    :param o_player: The name of the module containing the o player.
+    :param backend: The GameRunner backend, 'thread' or 'process'.
+    :param record_path: Optional. A game records file the game is appended to.
+    :param profile_dir: Optional. A directory the players' profiles are written to.
+    :param clock: Optional. The GameRunner clock, e.g. a utils.VirtualClock.
+    :return: A GameResult.
+    """
+    return GameRunner(setup_time, time_per_k_turns, k, 'n', x_player, o_player, backend, record_path,
+                      profile_dir, clock).play()
+
+
+def play_games(pairings, setup_time=2, time_per_k_turns=10, k=5, backend='thread', record_path=None,
+               profile_dir=None, clock=None):
+    """Plays a batch of games one after the other, without printing anything.
+
+    :param pairings: An iterable of (x player, o player) module names, one per game.
+    :return: A list of GameResult, in the order of the pairings.
+    """
+    return [play_game(x_player, o_player, setup_time, time_per_k_turns, k, backend, record_path, profile_dir, clock)
+            for x_player, o_player in pairings]
 
 
 if __name__ == '__main__':
     try:
         GameRunner(*sys.argv[1:]).run()
     except TypeError:
-        print("""Syntax: {0} setup_time time_per_k_turns k verbose x_player o_player
+        print("""Syntax: {0} setup_time time_per_k_turns k verbose x_player o_player [backend]
 For example: {0} 2 10 5 y interactive random_player
+Or, running each player in its own process: {0} 2 10 5 y simple_player random_player process
 Please read the docs in the code for more info.""".
               format(sys.argv[0]))
\ No newline at end of file
@@ -0,0 +1,258 @@
+"""A persistent store of solved positions: canonical position -> score, best move and search depth.
+
+The store is two files:
+    <path>      an open addressing hash table, memory-mapped read-only by the players. A lookup probes a slot or two.
+    <path>.log  records appended by offline jobs. They are merged into the table by compaction.
+
+Positions are keyed on their canonical form (see Reversi.bitboard.canonical) from the point of view of the player to
+move, so all the symmetric positions share one record. Scores are from the point of view of the player to move.
+
+For example:
+    python3 solved_db.py fill solved.db positions.bin --max-empties 12
+    python3 solved_db.py compact solved.db
+    python3 solved_db.py stats solved.db
+"""
+import argparse
+import mmap
+import os
+import struct
+
+from Reversi.bitboard import (FULL, canonical, popcount, solve, bit_to_move, transform_move,
+                              inverse_transform_move)
+
+MAGIC = b'RVSOLVED'
+HEADER = struct.Struct('<8sII')
+# own bits, opp bits, score, move (x * 8 + y, NO_MOVE if none), depth, flags
+RECORD = struct.Struct('<QQhBBB3x')
+NO_MOVE = 255
+# The score is the exact final disc difference. Without it the score is a search value of the given depth.
+EXACT = 1
+
+
+def log_path(path):
+    return path + '.log'
+
+
+def _slot(own, opp, capacity):
+    h = (own * 0x9E3779B97F4A7C15 ^ opp * 0xC2B2AE3D27D4EB4F) & FULL
+    h ^= h >> 31
+    return h & (capacity - 1)
+
+
+class SolvedPositionStore:
+    def __init__(self, path):
+        """Opens a store read-only. Opening only maps the file, so it costs the same for any store size.
+
+        :param path: The table file.
+        """
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.capacity, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not a solved positions store'.format(path))
+
+    def __getstate__(self):
+        # The players are pickled when they are handed over to the game runner, so the mapping is reopened instead.
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    @classmethod
+    def open(cls, path):
+        """Opens a store, or returns None if there is none at the given path.
+        """
+        if not os.path.isfile(path):
+            return None
+        return cls(path)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def get(self, own, opp):
+        """Looks up a canonical position.
+
+        :return: A tuple: (score, move index, depth, flags) or None.
+        """
+        slot = _slot(own, opp, self.capacity)
+        while True:
+            slot_own, slot_opp, score, move, depth, flags = RECORD.unpack_from(
+                self.map, HEADER.size + slot * RECORD.size)
+            if slot_own == own and slot_opp == opp:
+                return score, move, depth, flags
+            if slot_own == 0 and slot_opp == 0:
+                return None
+            slot = (slot + 1) & (self.capacity - 1)
+
+    def lookup(self, state):
+        """Looks up a GameState.
+
+        :param GameState state: The position.
+        :return: A tuple: (score for the player to move, best move in the state's coordinates or None, depth,
+                 True if the score is exact) or None if the position is not stored.
+        """
+        (own, opp, _), sym = state.canonical_key()
+        entry = self.get(own, opp)
+        if entry is None:
+            return None
+        score, move, depth, flags = entry
+        if move != NO_MOVE:
+            move = inverse_transform_move(divmod(move, 8), sym)
+        else:
+            move = None
+        return score, move, depth, bool(flags & EXACT)
+
+    def __iter__(self):
+        for slot in range(self.capacity):
+            record = RECORD.unpack_from(self.map, HEADER.size + slot * RECORD.size)
+            if record[0] or record[1]:
+                yield record
+
+
+class SolvedPositionWriter:
+    def __init__(self, path, buffer_size=4096):
+        """Appends records to the store's log in bulk. Safe to use while players read the table.
+
+        :param path: The table file. The records go to its log file.
+        :param buffer_size: The number of records written at once.
+        """
+        self.file = open(log_path(path), 'ab')
+        self.buffer_size = buffer_size
+        self.buffer = []
+
+    def add(self, own, opp, score, move=None, depth=0, exact=False):
+        """Adds a position of the player to move, owning 'own'.
+
+        :param score: The score for the player to move.
+        :param move: The best move (x, y) or None.
+        :param depth: The search depth, or the number of empty squares for exact scores.
+        :param exact: Whether the score is the exact final disc difference.
+        """
+        own, opp, sym = canonical(own, opp)
+        if move is None:
+            move_index = NO_MOVE
+        else:
+            x, y = transform_move(move, sym)
+            move_index = x * 8 + y
+        self.buffer.append(RECORD.pack(own, opp, score, move_index, depth, EXACT if exact else 0))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(b''.join(self.buffer))
+        self.file.flush()
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _better(new, old):
+    """Whether the record 'new' should replace 'old' for the same position: exact scores first, then deeper ones.
+    """
+    return (new[5] & EXACT, new[4]) >= (old[5] & EXACT, old[4])
+
+
+def compact(path):
+    """Merges the log into the table, keeping the best record of every position, and empties the log.
+    The new table replaces the old one atomically, so readers never see a partial file. Writers must not append
+    during compaction, as their records could be dropped with the log.
+
+    :return: The number of positions in the new table.
+    """
+    records = {}
+    store = SolvedPositionStore.open(path)
+    if store is not None:
+        for record in store:
+            records[record[:2]] = record
+        store.close()
+    if os.path.isfile(log_path(path)):
+        with open(log_path(path), 'rb') as log:
+            data = log.read()
+        # A crash while appending can leave the last record partly written. It is dropped.
+        for record in RECORD.iter_unpack(data[:len(data) - len(data) % RECORD.size]):
+            key = record[:2]
+            if key not in records or _better(record, records[key]):
+                records[key] = record
+
+    capacity = 16
+    while capacity < 2 * len(records):
+        capacity *= 2
+    table = bytearray(HEADER.size + capacity * RECORD.size)
+    HEADER.pack_into(table, 0, MAGIC, capacity, len(records))
+    for own, opp, score, move, depth, flags in records.values():
+        slot = _slot(own, opp, capacity)
+        while any(table[HEADER.size + slot * RECORD.size:HEADER.size + slot * RECORD.size + 16]):
+            slot = (slot + 1) & (capacity - 1)
+        RECORD.pack_into(table, HEADER.size + slot * RECORD.size, own, opp, score, move, depth, flags)
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as out:
+        out.write(table)
+    os.replace(temp_path, path)
+    open(log_path(path), 'wb').close()
+    return len(records)
+
+
+def fill(args):
+    """Solves exactly the positions of a tuning.py positions file with few empty squares, and appends them.
+    """
+    from tuning import POSITION_RECORD
+    seen = set()
+    solved = 0
+    with SolvedPositionWriter(args.path) as writer, open(args.positions, 'rb') as positions:
+        for x_bits, o_bits, side, _ in POSITION_RECORD.iter_unpack(positions.read()):
+            own, opp = (x_bits, o_bits) if side == 0 else (o_bits, x_bits)
+            empties = 64 - popcount(own | opp)
+            key = canonical(own, opp)[:2]
+            if empties > args.max_empties or key in seen:
+                continue
+            seen.add(key)
+            score, move = solve(own, opp)
+            writer.add(own, opp, score, bit_to_move(move) if move else None, empties, exact=True)
+            solved += 1
+    print('{} positions solved'.format(solved))
+
+
+def stats(args):
+    store = SolvedPositionStore(args.path)
+    print('{} positions in {} slots'.format(store.count, store.capacity))
+    log_size = os.path.getsize(log_path(args.path)) if os.path.isfile(log_path(args.path)) else 0
+    print('{} records waiting in the log'.format(log_size // RECORD.size))
+    store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintains a solved positions store.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    fill_parser = commands.add_parser('fill', help='Solve the endgame positions of a positions file.')
+    fill_parser.add_argument('path')
+    fill_parser.add_argument('positions')
+    fill_parser.add_argument('--max-empties', type=int, default=10)
+    fill_parser.set_defaults(func=fill)
+
+    compact_parser = commands.add_parser('compact', help='Merge the log into the table.')
+    compact_parser.add_argument('path')
+    compact_parser.set_defaults(func=lambda args: print('{} positions'.format(compact(args.path))))
+
+    stats_parser = commands.add_parser('stats', help='Print the table size.')
+    stats_parser.add_argument('path')
+    stats_parser.set_defaults(func=stats)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
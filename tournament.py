@@ -0,0 +1,240 @@
+"""Plays round-robin tournaments on a process pool.
+
+Every game is one task of a pool with one worker per available core. A worker imports the player modules once and
+plays all its games in-process with the headless runner (see run_game.play_game), and is pinned to its own core, so
+timed games do not compete for the same CPU. The results are appended to a JSON lines file, one game per line, as the
+games finish. Running the same tournament again on that file only plays the games missing from it.
+
+For example:
+    python3 tournament.py results.jsonl --players simple_player alpha_beta_player --times 2 10 --games 5
+
+With --node-time, the games are played in virtual time (see utils.VirtualClock): every node a player searches costs
+that many seconds of its budget, so time-control experiments run faster than real time and reproduce exactly.
+"""
+import argparse
+import functools
+import itertools
+import json
+import multiprocessing
+import os
+
+from Reversi.consts import TIE
+from instrumentation import GameStats, hot_spots
+from run_game import play_game
+from utils import VirtualClock
+
+DEFAULT_PLAYERS = ['simple_player', 'alpha_beta_player', 'min_max_player', 'better_player']
+DEFAULT_TIMES = ['2', '10', '50']
+
+# The core the worker is pinned to, or None
+_worker_core = None
+
+
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def init_worker(cores):
+    """The pool initializer. Pins the worker to the next free core.
+
+    :param cores: A multiprocessing.Queue of the cores to pin the workers to.
+    """
+    global _worker_core
+    _worker_core = cores.get()
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, {_worker_core})
+
+
+def make_pool(processes=None):
+    """
+    :param processes: The number of workers. Defaults to the number of available cores.
+    :return: A multiprocessing.Pool with every worker pinned to its own core.
+    """
+    cores = available_cores()
+    processes = processes or len(cores)
+    core_queue = multiprocessing.Queue()
+    for worker in range(processes):
+        core_queue.put(cores[worker % len(cores)])
+    return multiprocessing.Pool(processes, initializer=init_worker, initargs=(core_queue,))
+
+
+def make_tasks(players, times, games):
+    """Every ordered pairing of two different players, at every time, 'games' times.
+
+    :return: A list of (x player, o player, time per k turns, game index)
+    """
+    return [(p1, p2, time, game)
+            for p1, p2 in itertools.permutations(players, 2) for time in times for game in range(games)]
+
+
+def play_task(task, setup_time=2, k=5, record_path=None, profile_dir=None, node_time=None):
+    """Runs in the pool. Plays one game of the tournament, with p1 as x.
+    The game uses the thread backend, since the pool workers cannot start processes of their own.
+
+    :param record_path: Optional. A game records file (see Reversi.game_record) the game is appended to.
+    :param profile_dir: Optional. A directory the players' profiles are written to (see instrumentation.py).
+    :param node_time: Optional. Plays the game on a utils.VirtualClock charging this many seconds per node, so the
+                      times count the nodes searched instead of the real time.
+    :return: The game record, a dict.
+    """
+    p1, p2, time, game = task
+    clock = VirtualClock(node_time) if node_time is not None else None
+    result = play_game(p1, p2, setup_time, time, k, record_path=record_path, profile_dir=profile_dir, clock=clock)
+    record = {'p1': p1, 'p2': p2, 'time': time, 'game': game,
+              'winner_player': None if result.winner == TIE else result.players[result.winner],
+              'core': _worker_core}
+    record.update(result.to_dict())
+    return record
+
+
+def game_key(p1, p2, time, game):
+    return p1, p2, str(time), game
+
+
+class ResultsStore:
+    def __init__(self, path):
+        """An append-only JSON lines file of game records, keyed by pairing, time and game index, with the score
+        aggregates kept up to date as the records are added. Opening an existing file replays it, so an interrupted
+        tournament resumes where it stopped.
+
+        :param path: The results file. Created if missing.
+        """
+        self.path = path
+        self.keys = set()
+        # player -> time -> points
+        self.scores = {}
+        # (p1, p2, time) -> [games, p1 points]
+        self.pairings = {}
+        if os.path.isfile(path):
+            with open(path, 'rb+') as results:
+                end = 0
+                for line in results:
+                    if not line.endswith(b'\n'):
+                        # The line was cut short by a crash. It is dropped and its game is played again.
+                        results.truncate(end)
+                        break
+                    end += len(line)
+                    self.aggregate(json.loads(line.decode()))
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        """Yields the stored game records, reading the file again.
+        """
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, 'r') as results:
+            for line in results:
+                yield json.loads(line)
+
+    def aggregate(self, record):
+        p1, p2, time = record['p1'], record['p2'], str(record['time'])
+        key = game_key(p1, p2, time, record['game'])
+        if key in self.keys:
+            return
+        self.keys.add(key)
+        p1_points = record_points(record)
+        for player, points in ((p1, p1_points), (p2, 1 - p1_points)):
+            player_scores = self.scores.setdefault(player, {})
+            player_scores[time] = player_scores.get(time, 0) + points
+        pairing = self.pairings.setdefault((p1, p2, time), [0, 0])
+        pairing[0] += 1
+        pairing[1] += p1_points
+
+    def add(self, record):
+        """Appends a game record and updates the aggregates.
+        """
+        with open(self.path, 'a') as results:
+            # A crash can only cut short the last line, which is dropped when the store is opened again
+            results.write(json.dumps(record) + '\n')
+        self.aggregate(record)
+
+    def score_table(self, players, times):
+        """
+        :return: A dict: player -> time -> points, with every given player and time.
+        """
+        return {player: {str(time): self.scores.get(player, {}).get(str(time), 0) for time in times}
+                for player in players}
+
+    def write_games_csv(self, path):
+        """Writes one line per game: p1, p2, time, p1 points, p2 points.
+        """
+        with open(path, 'w') as out:
+            for record in self:
+                p1_points = record_points(record)
+                out.write('{},{},{},{:g},{:g}\n'.format(record['p1'], record['p2'], record['time'],
+                                                        p1_points, 1 - p1_points))
+
+
+def record_points(record):
+    """
+    :return: p1's points in a game record: 1 for a win, 0.5 for a tie and 0 for a loss.
+    """
+    if record['winner_player'] is None:
+        return 0.5
+    return 1 if record['winner_player'] == record['p1'] else 0
+
+
+def run_tournament(store, players=DEFAULT_PLAYERS, times=DEFAULT_TIMES, games=5, processes=None, **game_options):
+    """Plays the games of the tournament missing from the store, and adds their records to it.
+
+    :param store: A ResultsStore.
+    :param processes: The number of workers. Defaults to the number of available cores.
+    :param game_options: setup_time, k, record_path, profile_dir and node_time, passed to play_task.
+    :return: The number of games played.
+    """
+    tasks = [task for task in make_tasks(players, times, games) if game_key(*task) not in store]
+    print('{} games to play, {} already played'.format(len(tasks), len(store)))
+    if not tasks:
+        return 0
+
+    play = functools.partial(play_task, **game_options)
+    with make_pool(processes) as pool:
+        # One game per task, so a slow pairing does not hold back the others
+        for record in pool.imap_unordered(play, tasks, chunksize=1):
+            store.add(record)
+            print('{p1} vs {p2}, t = {time}, game {game}: {winner_player}'.format(**record))
+    return len(tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plays a round-robin tournament on all cores.')
+    parser.add_argument('results', help='The JSON lines results file. The games already in it are not played again.')
+    parser.add_argument('--players', nargs='+', default=DEFAULT_PLAYERS)
+    parser.add_argument('--times', nargs='+', default=DEFAULT_TIMES, help='Seconds per k turns.')
+    parser.add_argument('--games', type=int, default=5, help='Games per ordered pairing and time.')
+    parser.add_argument('--setup-time', type=float, default=2)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--processes', type=int, default=None, help='Defaults to the number of available cores.')
+    parser.add_argument('--records', default=None, help='Also append the games to this game records file.')
+    parser.add_argument('--stats', action='store_true', help="Print the players' move time statistics.")
+    parser.add_argument('--profile', default=None, help="Profile the players' moves into this directory.")
+    parser.add_argument('--node-time', type=float, default=None,
+                        help='Play in virtual time, charging this many seconds per searched node.')
+    args = parser.parse_args()
+
+    store = ResultsStore(args.results)
+    run_tournament(store, args.players, args.times, args.games, args.processes,
+                   setup_time=args.setup_time, k=args.k, record_path=args.records, profile_dir=args.profile,
+                   node_time=args.node_time)
+    for player, player_scores in sorted(store.score_table(args.players, args.times).items()):
+        print('{}: {}'.format(player, ', '.join('t = {}: {:g}'.format(time, player_scores[time])
+                                                 for time in args.times)))
+    if args.stats:
+        stats = GameStats()
+        for record in store:
+            stats.add_result(record)
+        print(stats.report())
+    if args.profile:
+        for player_name, report in sorted(hot_spots(args.profile).items()):
+            print('Hot spots of {}:\n{}'.format(player_name, report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Training and benchmarking of the competition player's neural evaluator.
+
+    train - fits the MLP on a positions file written by 'tuning.py generate' and saves it as
+            players/competition_player/mlp.npz. The competition player uses it from then on.
+    bench - measures the per-leaf cost of the batched MLP against the hand-written utility.
+
+For example:
+    python3 tuning.py generate positions.bin --games 2000 --noise 0.1
+    python3 train_mlp.py train positions.bin --epochs 5
+    python3 train_mlp.py bench
+
+Everything runs on the CPU with NumPy.
+"""
+import argparse
+import copy
+import os
+import random
+import time
+
+import numpy as np
+
+from Reversi.board import GameState
+from Reversi.consts import X_PLAYER
+from players.competition_player import Player, MLP_PATH
+from players.competition_player.mlp import MLPEvaluator, OUTPUT_SCALE, bits_to_planes
+from tuning import iter_chunks
+
+
+def training_batches(path, chunk_size, batch_size, rng):
+    """Yields shuffled (inputs, targets) mini-batches, each position once from each player's point of view.
+    """
+    for records in iter_chunks(path, chunk_size):
+        x_to_move = records['side'] == 0
+        inputs = np.concatenate([bits_to_planes(records['x'], records['o'], x_to_move),
+                                 bits_to_planes(records['o'], records['x'], ~x_to_move)])
+        result = records['result'].astype(np.float32) / OUTPUT_SCALE
+        targets = np.concatenate([result, -result])
+        order = rng.permutation(len(targets))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            yield inputs[batch], targets[batch]
+
+
+def train(args):
+    rng = np.random.RandomState(args.seed)
+    if args.resume and os.path.isfile(args.out):
+        model = MLPEvaluator.load(args.out)
+    else:
+        model = MLPEvaluator(rng.randn(129, args.hidden) * np.sqrt(2 / 129), np.zeros(args.hidden),
+                             rng.randn(args.hidden, 1) * np.sqrt(1 / args.hidden), np.zeros(1))
+    params = [model.w1, model.b1, model.w2, model.b2]
+    # Adam optimizer state
+    moments = [np.zeros_like(p) for p in params]
+    velocities = [np.zeros_like(p) for p in params]
+    step = 0
+
+    for epoch in range(args.epochs):
+        total_loss = 0.0
+        samples = 0
+        for inputs, targets in training_batches(args.positions, args.chunk_size, args.batch_size, rng):
+            pre_hidden = inputs @ model.w1 + model.b1
+            hidden = np.maximum(pre_hidden, 0)
+            output = np.tanh(hidden @ model.w2 + model.b2)[:, 0]
+            error = output - targets
+            total_loss += float(error @ error)
+            samples += len(targets)
+
+            d_out = (2 * error * (1 - output ** 2) / len(targets))[:, None].astype(np.float32)
+            d_hidden = (d_out @ model.w2.T) * (pre_hidden > 0)
+            grads = [inputs.T @ d_hidden, d_hidden.sum(axis=0), hidden.T @ d_out, d_out.sum(axis=0)]
+
+            step += 1
+            for param, grad, m, v in zip(params, grads, moments, velocities):
+                m *= 0.9
+                m += 0.1 * grad
+                v *= 0.999
+                v += 0.001 * grad ** 2
+                param -= (args.learning_rate * (m / (1 - 0.9 ** step)) /
+                          (np.sqrt(v / (1 - 0.999 ** step)) + 1e-8)).astype(np.float32)
+        print('epoch {}: mse {:.5f}'.format(epoch + 1, total_loss / max(samples, 1)))
+
+    model.save(args.out)
+
+
+def random_positions(count, seed):
+    rng = random.Random(seed)
+    states = []
+    while len(states) < count:
+        state = GameState()
+        while len(states) < count:
+            possible_moves = state.get_possible_moves()
+            if not possible_moves:
+                break
+            states.append(copy.deepcopy(state))
+            move = rng.choice(possible_moves)
+            state.perform_move(move[0], move[1])
+    return states
+
+
+def bench(args):
+    states = random_positions(args.positions, args.seed)
+    player = Player(1, X_PLAYER, 1, 1)
+
+    start = time.perf_counter()
+    for state in states:
+        player.utility(state)
+    handcrafted = (time.perf_counter() - start) / len(states)
+
+    model = MLPEvaluator.load(args.weights) if os.path.isfile(args.weights) else MLPEvaluator(
+        np.random.randn(129, args.hidden), np.zeros(args.hidden), np.random.randn(args.hidden, 1), np.zeros(1))
+    print('handcrafted utility: {:.2f} us/leaf'.format(handcrafted * 1e6))
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        for first in range(0, len(states), batch_size):
+            model.evaluate(states[first:first + batch_size], X_PLAYER)
+        neural = (time.perf_counter() - start) / len(states)
+        print('mlp, batches of {}: {:.2f} us/leaf ({:.1f}x)'.format(batch_size, neural * 1e6, handcrafted / neural))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Trains and benchmarks the competition player neural evaluator.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    train_parser = commands.add_parser('train', help='Train the MLP on a positions file.')
+    train_parser.add_argument('positions')
+    train_parser.add_argument('--hidden', type=int, default=32)
+    train_parser.add_argument('--epochs', type=int, default=5)
+    train_parser.add_argument('--batch-size', type=int, default=256)
+    train_parser.add_argument('--chunk-size', type=int, default=1000000)
+    train_parser.add_argument('--learning-rate', type=float, default=0.001)
+    train_parser.add_argument('--resume', action='store_true', help='Continue training the existing weights.')
+    train_parser.add_argument('--seed', type=int, default=0)
+    train_parser.add_argument('--out', default=MLP_PATH)
+    train_parser.set_defaults(func=train)
+
+    bench_parser = commands.add_parser('bench', help='Compare the per-leaf cost with the hand-written utility.')
+    bench_parser.add_argument('--positions', type=int, default=2000)
+    bench_parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    bench_parser.add_argument('--hidden', type=int, default=32, help='Hidden size when no weights file exists.')
+    bench_parser.add_argument('--weights', default=MLP_PATH)
+    bench_parser.add_argument('--seed', type=int, default=0)
+    bench_parser.set_defaults(func=bench)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""Offline tuning of the competition player's utility weights.
+
+The pipeline has three stages:
+    generate - plays headless self-play games and appends every position with the final result to a positions file.
+    fit      - streams the positions file in chunks, extracts the utility terms with NumPy and fits the weights by
+               least-squares or logistic regression.
+    The fit writes players/competition_player/weights.json, which the competition player loads at setup time.
+
+For example:
+    python3 tuning.py generate positions.bin --games 2000 --noise 0.1
+    python3 tuning.py fit positions.bin --method logistic
+
+Everything runs on the CPU. Only the 'fit' stage needs NumPy.
+"""
+import argparse
+import json
+import os
+import random
+import struct
+import sys
+
+from Reversi.board import GameState
+from Reversi.bitboard import from_state, popcount
+from Reversi.consts import X_PLAYER, O_PLAYER
+
+WEIGHT_NAMES = ['delta_tiles', 'mobility', 'potential_mobility', 'corner_ratio']
+
+# One record per position: X bits, O bits, the player to move (0 for X, 1 for O) and the final X-O disc difference.
+POSITION_RECORD = struct.Struct('<QQBb')
+
+
+def position_dtype():
+    import numpy as np
+    return np.dtype([('x', '<u8'), ('o', '<u8'), ('side', 'u1'), ('result', 'i1')])
+
+
+def make_player(name, color, time_per_k_turns, k):
+    __import__('players.{}'.format(name))
+    return sys.modules['players.{}'.format(name)].Player(1, color, time_per_k_turns, k)
+
+
+def self_play_game(x_player, o_player, noise, rng, opening=(), scores=None):
+    """Plays one game without time limits or printing.
+
+    :param x_player: The X player instance.
+    :param o_player: The O player instance.
+    :param noise: The probability of replacing a player's move with a random legal move.
+    :param rng: A random.Random instance.
+    :param opening: Moves (x, y) to play before the players take over.
+    :param scores: Optional. A list that gets the search_score of the player for every move, None for the opening and
+                   random moves.
+    :return: A tuple: (list of (x bits, o bits, side) for every position, the list of moves played,
+             the final X-O disc difference)
+    """
+    players = {X_PLAYER: x_player, O_PLAYER: o_player}
+    state = GameState()
+    positions = []
+    moves = []
+    while True:
+        possible_moves = state.get_possible_moves()
+        if not possible_moves:
+            break
+        x_bits, o_bits = from_state(state)
+        positions.append((x_bits, o_bits, 0 if state.curr_player == X_PLAYER else 1))
+        score = None
+        if len(moves) < len(opening):
+            move = list(opening[len(moves)])
+        elif rng.random() < noise:
+            move = rng.choice(possible_moves)
+        else:
+            move = players[state.curr_player].get_move(state.snapshot(), possible_moves)
+            score = getattr(players[state.curr_player], 'search_score', None)
+        if scores is not None:
+            scores.append(score)
+        state.perform_move(move[0], move[1])
+        moves.append(move)
+
+    x_bits, o_bits = from_state(state)
+    return positions, moves, popcount(x_bits) - popcount(o_bits)
+
+
+def generate(args):
+    rng = random.Random(args.seed)
+    with open(args.positions, 'ab') as out:
+        for game in range(args.games):
+            x_name, o_name = args.players if game % 2 == 0 else reversed(args.players)
+            x_player = make_player(x_name, X_PLAYER, args.time, 1)
+            o_player = make_player(o_name, O_PLAYER, args.time, 1)
+            positions, _, result = self_play_game(x_player, o_player, args.noise, rng)
+            out.write(b''.join(POSITION_RECORD.pack(x_bits, o_bits, side, result)
+                               for x_bits, o_bits, side in positions))
+            if (game + 1) % 100 == 0:
+                print('{} games played'.format(game + 1))
+
+
+def iter_chunks(path, chunk_size):
+    """Yields the records of a positions file in chunks, without loading the whole file.
+    """
+    import numpy as np
+    dtype = position_dtype()
+    count = os.path.getsize(path) // dtype.itemsize
+    if count == 0:
+        return
+    records = np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+    for start in range(0, count, chunk_size):
+        yield np.array(records[start:start + chunk_size])
+
+
+def extract_features(records):
+    """Computes the utility terms and targets of a chunk of records, once from each player's point of view.
+
+    :return: A tuple: (features of shape (2N, 4), final disc difference from the same point of view of shape (2N,))
+    """
+    import numpy as np
+    from Reversi.bitboard_np import evaluation_features
+    features = np.concatenate([evaluation_features(records['x'], records['o']),
+                               evaluation_features(records['o'], records['x'])])
+    result = records['result'].astype(np.float64)
+    return features, np.concatenate([result, -result])
+
+
+def fit_least_squares(path, chunk_size):
+    import numpy as np
+    xtx = np.zeros((len(WEIGHT_NAMES), len(WEIGHT_NAMES)))
+    xty = np.zeros(len(WEIGHT_NAMES))
+    for records in iter_chunks(path, chunk_size):
+        features, target = extract_features(records)
+        xtx += features.T @ features
+        xty += features.T @ target
+    return np.linalg.lstsq(xtx, xty, rcond=None)[0]
+
+
+def fit_logistic(path, chunk_size, iterations):
+    """Fits P(win) = sigmoid(features . w) by Newton's method, one pass over the file per iteration. Draws count as
+    half a win.
+    """
+    import numpy as np
+    w = np.zeros(len(WEIGHT_NAMES))
+    for _ in range(iterations):
+        gradient = np.zeros(len(WEIGHT_NAMES))
+        hessian = np.zeros((len(WEIGHT_NAMES), len(WEIGHT_NAMES)))
+        for records in iter_chunks(path, chunk_size):
+            features, target = extract_features(records)
+            target = (np.sign(target) + 1) / 2
+            p = 1 / (1 + np.exp(-(features @ w)))
+            gradient += features.T @ (target - p)
+            hessian += (features * (p * (1 - p))[:, None]).T @ features
+        w += np.linalg.lstsq(hessian, gradient, rcond=None)[0]
+    return w
+
+
+def fit(args):
+    if args.method == 'lstsq':
+        w = fit_least_squares(args.positions, args.chunk_size)
+    else:
+        w = fit_logistic(args.positions, args.chunk_size, args.iterations)
+    # The utility only has to order positions, so the weights are scaled to keep delta_tiles at 1 like the
+    # hand-picked ones. That keeps the values far below the INFINITY win sentinel.
+    if w[0] > 0:
+        w = w / w[0]
+    weights = {name: float(value) for name, value in zip(WEIGHT_NAMES, w)}
+    with open(args.out, 'w') as out:
+        json.dump(weights, out, indent=4)
+    print(json.dumps(weights, indent=4))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tunes the competition player utility weights.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    generate_parser = commands.add_parser('generate', help='Append self-play positions to a positions file.')
+    generate_parser.add_argument('positions')
+    generate_parser.add_argument('--games', type=int, default=100)
+    generate_parser.add_argument('--players', nargs=2, default=['simple_player', 'simple_player'])
+    generate_parser.add_argument('--time', type=float, default=0.1, help='Seconds per move for the players.')
+    generate_parser.add_argument('--noise', type=float, default=0.1)
+    generate_parser.add_argument('--seed', type=int, default=None)
+    generate_parser.set_defaults(func=generate)
+
+    fit_parser = commands.add_parser('fit', help='Fit the weights and write the weights file.')
+    fit_parser.add_argument('positions')
+    fit_parser.add_argument('--method', choices=['lstsq', 'logistic'], default='lstsq')
+    fit_parser.add_argument('--chunk-size', type=int, default=1000000)
+    fit_parser.add_argument('--iterations', type=int, default=8)
+    fit_parser.add_argument('--out', default=os.path.join('players', 'competition_player', 'weights.json'))
+    fit_parser.set_defaults(func=fit)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
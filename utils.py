@@ -1,15 +1,22 @@
 """Generic utility functions
 """
 import copy
+import json
+import os
 import time
-from multiprocessing import Queue
+from multiprocessing import Pipe, Process, Queue
 # from __future__ import print_function
-from threading import Thread
+from threading import Event, Thread, get_ident
 
 from Reversi.board import GameState
 
 INFINITY = float(6000)
 
+# The real time a call measured on a VirtualClock may take, at least VIRTUAL_WALL_LIMIT seconds and at least
+# VIRTUAL_WALL_FACTOR times its virtual time limit, so that a player that never charges its clock cannot hang the game
+VIRTUAL_WALL_LIMIT = 60.0
+VIRTUAL_WALL_FACTOR = 10
+
 
 class ExceededTimeError(RuntimeError):
     """Thrown when the given function exceeded its runtime.
@@ -17,6 +24,54 @@ class ExceededTimeError(RuntimeError):
     pass
 
 
+class PlayerCrashedError(RuntimeError):
+    """Thrown when a player's process died, e.g. killed by the out of memory killer. The player forfeits the game.
+    """
+    pass
+
+
+class WallClock:
+    """The real time. The clock of the game runner and the players, unless a VirtualClock is given.
+    """
+    virtual = False
+
+    def time(self):
+        return time.time()
+
+    def charge(self, nodes=1):
+        pass
+
+
+class VirtualClock:
+    virtual = True
+
+    def __init__(self, node_time=1e-4):
+        """A clock that only moves when searched nodes are charged to it, so the time a search takes depends on the
+        nodes it visits and not on the machine or its load. Games played on it run faster than real time and
+        reproduce exactly, given deterministic players.
+
+        :param node_time: The virtual seconds a node costs.
+        """
+        self.node_time = node_time
+        self.now = 0.0
+        # Thread id -> the cancelled Event of the run_with_limited_time call running in the thread. The charges of a
+        # call that timed out stop counting, since its thread cannot be stopped and would move the clock of the later
+        # calls and games.
+        self.calls = {}
+
+    def time(self):
+        return self.now
+
+    def charge(self, nodes=1):
+        cancelled = self.calls.get(get_ident())
+        if cancelled is not None and cancelled.is_set():
+            return
+        self.now += nodes * self.node_time
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
 def function_wrapper(func, args, kwargs, result_queue):
     """Runs the given function and measures its runtime.
 
@@ -37,16 +92,54 @@ def function_wrapper(func, args, kwargs, result_queue):
     result_queue.put((result, runtime))
 
 
-def run_with_limited_time(func, args, kwargs, time_limit):
+def virtual_function_wrapper(func, args, kwargs, clock, cancelled, outcome):
+    """Runs the given function and measures its runtime on a VirtualClock.
+
+    :param cancelled: An Event, set if the call timed out. The function's charges to the clock are ignored from then on.
+    :param outcome: A list, to which the tuple (the function return value, its runtime) or the raised exception is
+                    appended.
+    """
+    clock.calls[get_ident()] = cancelled
+    start = clock.time()
+    try:
+        result = func(*args, **kwargs)
+    except Exception as e:
+        outcome.append(e)
+        return
+    finally:
+        del clock.calls[get_ident()]
+    outcome.append((result, clock.time() - start))
+
+
+def run_with_limited_time(func, args, kwargs, time_limit, clock=None):
     """Runs a function with time limit
 
     :param func: The function to run.
     :param args: The functions args, given as tuple.
     :param kwargs: The functions keywords, given as dict.
     :param time_limit: The time limit in seconds (can be float).
+    :param clock: Optional. With a VirtualClock, the function runs until it returns, while this thread waits, and its
+                  running time is measured in virtual time. Only a real time backstop (see VIRTUAL_WALL_LIMIT) stops
+                  it early.
     :return: A tuple: The function's return value unchanged, and the running time for the function.
     :raises PlayerExceededTimeError: If player exceeded its given time.
     """
+    if clock is not None and clock.virtual:
+        outcome = []
+        cancelled = Event()
+        t = Thread(target=virtual_function_wrapper, args=(func, args, kwargs, clock, cancelled, outcome), daemon=True)
+        t.start()
+        t.join(max(VIRTUAL_WALL_LIMIT, VIRTUAL_WALL_FACTOR * time_limit))
+        if t.is_alive():
+            cancelled.set()
+            raise ExceededTimeError
+        if isinstance(outcome[0], Exception):
+            raise outcome[0]
+        result, runtime = outcome[0]
+        if runtime > time_limit:
+            raise ExceededTimeError
+        return result, runtime
+
     q = Queue()
     t = Thread(target=function_wrapper, args=(func, args, kwargs, q))
     t.start()
@@ -64,9 +157,182 @@ def run_with_limited_time(func, args, kwargs, time_limit):
     return q_get
 
 
+def player_process_main(connection, player_class, player_args):
+    """The loop of a PlayerProcess. Answers each request with a tuple: (result, wall time, CPU time), or with the
+    exception the player raised.
+    """
+    player = None
+    while True:
+        request = connection.recv()
+        if request[0] == 'stop':
+            if player is not None:
+                player.stop()
+            return
+        start, cpu_start = time.time(), time.process_time()
+        try:
+            if request[0] == 'setup':
+                player = player_class(*player_args)
+                result = repr(player)
+            else:
+                result = player.get_move(*request[1:]), getattr(player, 'search_info', None)
+        except Exception as e:
+            connection.send(e)
+            continue
+        connection.send((result, time.time() - start, time.process_time() - cpu_start))
+
+
+class PlayerProcess:
+    """Runs a player in its own long-lived process, and talks to it over a pipe.
+    A request that exceeds its time limit gets the process killed, so an overrunning player stops using the CPU, and
+    the process is restarted for the next setup. The times are measured in the player's process, so they do not
+    include the communication.
+    """
+
+    def __init__(self, player_class, player_args):
+        """
+        :param player_class: The player class. Must be importable by the player's process.
+        :param player_args: The player class arguments as tuple.
+        """
+        self.player_class = player_class
+        self.player_args = player_args
+        self.process = None
+        self.connection = None
+        self.name = player_class.__module__
+
+    def start(self):
+        self.connection, child_connection = Pipe()
+        self.process = Process(target=player_process_main,
+                               args=(child_connection, self.player_class, self.player_args), daemon=True)
+        self.process.start()
+
+    def kill(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+            self.connection.close()
+            self.process = None
+
+    def stop(self):
+        if self.process is not None:
+            try:
+                self.connection.send(('stop',))
+            except OSError:
+                # The process is already gone
+                self.kill()
+                return
+            self.process.join()
+            self.connection.close()
+            self.process = None
+
+    def request(self, request, time_limit):
+        """
+        :return: A tuple: (The request's result, its wall time, its CPU time)
+        :raises ExceededTimeError: If the player exceeded the time limit. Its process is killed.
+        :raises PlayerCrashedError: If the player's process died. What is left of it is killed.
+        """
+        if self.process is None:
+            self.start()
+        try:
+            self.connection.send(request)
+            if not self.connection.poll(time_limit):
+                self.kill()
+                raise ExceededTimeError
+            reply = self.connection.recv()
+        except (EOFError, OSError):
+            self.kill()
+            raise PlayerCrashedError('The process of {} died'.format(self.name))
+        if isinstance(reply, BaseException):
+            raise reply
+        return reply
+
+    def setup(self, time_limit):
+        """Initializes the player. Restarts the process if it was killed.
+
+        :return: A tuple: (The setup wall time, its CPU time)
+        """
+        self.name, wall_time, cpu_time = self.request(('setup',), time_limit)
+        return wall_time, cpu_time
+
+    def get_move(self, game_state, possible_moves, time_limit):
+        """
+        :return: A tuple: (The player's move, its wall time, its CPU time, the player's search_info after the move)
+        """
+        (move, search_info), wall_time, cpu_time = self.request(('get_move', game_state, possible_moves), time_limit)
+        return move, wall_time, cpu_time, search_info
+
+    def __repr__(self):
+        return self.name
+
+
+class SearchTracer:
+    """Records the timeline of searches as Chrome trace events, viewable in chrome://tracing or Perfetto.
+    A search class given a tracer emits a span for every top level search call, which is an iteration of an iterative
+    deepening, a span for every root move with its node count, and an instant event when the deadline aborts the
+    search. Callers can add spans of their own, e.g. for a whole move.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.origin = time.time()
+        # The state of the search being traced, or None between searches
+        self.root = None
+        self.aborted = False
+        self.move_start = None
+        self.move_nodes = 0
+
+    def now(self):
+        """
+        :return: The time since the tracer was created, in microseconds.
+        """
+        return (time.time() - self.origin) * 1e6
+
+    def span(self, name, start, args=None):
+        """Adds a span that started at 'start' (see now) and ends now.
+        """
+        self.events.append({'name': name, 'ph': 'X', 'ts': start, 'dur': self.now() - start, 'pid': os.getpid(),
+                            'tid': get_ident(), 'args': args or {}})
+
+    def instant(self, name, args=None):
+        self.events.append({'name': name, 'ph': 'i', 's': 't', 'ts': self.now(), 'pid': os.getpid(),
+                            'tid': get_ident(), 'args': args or {}})
+
+    def trace_iteration(self, search, state, *args):
+        """Runs a top level search call of a search class, as a traced iteration.
+
+        :param search: The MiniMaxAlgorithm or MiniMaxWithAlphaBetaPruning instance.
+        :param args: The arguments of its search method after the state. The depth comes first.
+        """
+        start, nodes = self.now(), search.nodes
+        self.root = state
+        self.aborted = False
+        try:
+            value, move = search.search(state, *args)
+        finally:
+            self.root = None
+        self.span('depth {}'.format(args[0]), start, {'nodes': search.nodes - nodes, 'value': value,
+                                                      'move': move, 'aborted': value is None})
+        return value, move
+
+    def begin_move(self, nodes):
+        self.move_start = self.now()
+        self.move_nodes = nodes
+
+    def end_move(self, move, value, nodes):
+        self.span('move {}'.format(list(move)), self.move_start, {'nodes': nodes - self.move_nodes, 'value': value})
+
+    def deadline(self):
+        if not self.aborted:
+            self.aborted = True
+            self.instant('deadline')
+
+    def write(self, path):
+        with open(path, 'w') as out:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, out)
+
+
 class MiniMaxAlgorithm:
 
-    def __init__(self, utility, my_color, no_more_time, selective_deepening):
+    def __init__(self, utility, my_color, no_more_time, selective_deepening, tracer=None, clock=None):
         """Initialize a MiniMax algorithms without alpha-beta pruning.
 
         :param utility: The utility function. Should have state as parameter.
@@ -77,11 +343,17 @@ class MiniMaxAlgorithm:
                         returns True when the algorithm should continue the search
                         for the minimax value recursivly from this state.
                         optional
+        :param tracer: Optional. A SearchTracer recording the timeline of the searches.
+        :param clock: Optional. The player's clock, charged for every node searched.
         """
         self.utility = utility
         self.my_color = my_color
         self.no_more_time = no_more_time
         self.selective_deepening = selective_deepening
+        self.tracer = tracer
+        self.clock = clock
+        # The number of nodes searched by this instance, over all its searches
+        self.nodes = 0
 
     def search(self, state, depth, maximizing_player):
         """Start the MiniMax algorithm.
@@ -91,8 +363,15 @@ class MiniMaxAlgorithm:
         :param maximizing_player: Whether this is a max node (True) or a min node (False).
         :return: A tuple: (The min max algorithm value, The move in case of max node or None in min mode)
         """
+        if self.tracer is not None and self.tracer.root is None:
+            return self.tracer.trace_iteration(self, state, depth, maximizing_player)
         if self.no_more_time():
+            if self.tracer is not None:
+                self.tracer.deadline()
             return None, None
+        self.nodes += 1
+        if self.clock is not None:
+            self.clock.charge()
         u = self.utility(state)
         if u == INFINITY or u == -INFINITY or depth == 0:
             return u, state
@@ -102,7 +381,12 @@ class MiniMaxAlgorithm:
         for move in possible_moves:
             next_state = copy.deepcopy(state)
             next_state.perform_move(move[0], move[1])
+            root_move = self.tracer is not None and state is self.tracer.root
+            if root_move:
+                self.tracer.begin_move(self.nodes)
             best_val, _ = self.search(next_state, depth - 1, not maximizing_player)
+            if root_move:
+                self.tracer.end_move(move, best_val, self.nodes)
 
             if best_val is None:  # if there is no more time, best_val is None
                 return None, None
@@ -125,7 +409,8 @@ class MiniMaxAlgorithm:
 
 class MiniMaxWithAlphaBetaPruning:
 
-    def __init__(self, utility, my_color, no_more_time, selective_deepening):
+    def __init__(self, utility, my_color, no_more_time, selective_deepening, batch_utility=None, tracer=None,
+                 clock=None):
         """Initialize a MiniMax algorithms with alpha-beta pruning.
 
         :param utility: The utility function. Should have state as parameter.
@@ -135,11 +420,22 @@ class MiniMaxWithAlphaBetaPruning:
         :param selective_deepening: A functions that gets the current state, and
                         returns True when the algorithm should continue the search
                         for the minimax value recursivly from this state.
+        :param batch_utility: Optional. A function that gets a list of states and returns a list of their utilities.
+                        When given, the leaves below each depth 1 node are evaluated with a single call to it,
+                        instead of one utility call per leaf.
+        :param tracer: Optional. A SearchTracer recording the timeline of the searches. Root moves evaluated by
+                        batch_utility get no span of their own.
+        :param clock: Optional. The player's clock, charged for every node searched.
         """
         self.utility = utility
         self.my_color = my_color
         self.no_more_time = no_more_time
         self.selective_deepening = selective_deepening
+        self.batch_utility = batch_utility
+        self.tracer = tracer
+        self.clock = clock
+        # The number of nodes searched by this instance, over all its searches
+        self.nodes = 0
 
     def search(self, state, depth, alpha, beta, maximizing_player):
         """Start the MiniMax algorithm.
@@ -151,18 +447,38 @@ class MiniMaxWithAlphaBetaPruning:
         :param maximizing_player: Whether this is a max node (True) or a min node (False).
         :return: A tuple: (The alpha-beta algorithm value, The move in case of max node or None in min mode)
         """
+        if self.tracer is not None and self.tracer.root is None:
+            return self.tracer.trace_iteration(self, state, depth, alpha, beta, maximizing_player)
         if self.no_more_time():
+            if self.tracer is not None:
+                self.tracer.deadline()
             return None, None
+        self.nodes += 1
+        if self.clock is not None:
+            self.clock.charge()
         u = self.utility(state)
         if u == INFINITY or u == -INFINITY or depth == 0:
             return u, state
         possible_moves = state.get_possible_moves()
         optimal_move = None
         optimal_value = -INFINITY if maximizing_player else INFINITY
-        for move in possible_moves:
-            next_state = copy.deepcopy(state)
-            next_state.perform_move(move[0], move[1])
-            best_val, _ = self.search(next_state, depth - 1, alpha, beta, not maximizing_player)
+        leaf_values = None
+        if depth == 1 and self.batch_utility is not None:
+            leaf_values = self.batch_utility([self.next_state(state, move) for move in possible_moves])
+            self.nodes += len(possible_moves)
+            if self.clock is not None:
+                self.clock.charge(len(possible_moves))
+        for i, move in enumerate(possible_moves):
+            if leaf_values is not None:
+                best_val = leaf_values[i]
+            else:
+                next_state = self.next_state(state, move)
+                root_move = self.tracer is not None and state is self.tracer.root
+                if root_move:
+                    self.tracer.begin_move(self.nodes)
+                best_val, _ = self.search(next_state, depth - 1, alpha, beta, not maximizing_player)
+                if root_move:
+                    self.tracer.end_move(move, best_val, self.nodes)
 
             if best_val is None:  # if there is no more time, best_val is None
                 return None, None
@@ -187,3 +503,9 @@ class MiniMaxWithAlphaBetaPruning:
                     if optimal_value <= alpha:
                         return -INFINITY, None
         return optimal_value, optimal_move
+
+    @staticmethod
+    def next_state(state, move):
+        next_state = copy.deepcopy(state)
+        next_state.perform_move(move[0], move[1])
+        return next_state